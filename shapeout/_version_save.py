@@ -0,0 +1,3 @@
+#!/usr/bin/env python
+# This file was created automatically
+longversion = '2020.04.28-17-58-15'
@@ -3,22 +3,27 @@
 """Shape-Out - Analysis class"""
 from __future__ import division, unicode_literals
 
-import gc
+import multiprocessing as mp
+from multiprocessing.pool import ThreadPool
 import pathlib
 import pkg_resources
 import warnings
 import sys
+import weakref
 
-import chaco.api as ca
-from chaco.color_mapper import ColorMapper
 import numpy as np
 import scipy.stats
 
 import dclab
 import dclab.definitions as dfn
 from dclab.rtdc_dataset import config as dclab_config
+from dclab.util import hashobj
 
+from . import kde  # noqa: F401 (registers additional KDE methods)
 from .settings import get_ignored_features, SettingsFile
+from .util.cache import (DATASET_LOCK, LRUCache, get_feature_key,
+                         get_filter_fingerprint)
+from .util.memory import MemoryBudget, get_memory_usage
 
 
 if sys.version_info[0] == 2:
@@ -27,10 +32,31 @@ else:
     str_classes = str
 
 
+class MeasurementLoadError(BaseException):
+    """Raised when one or more measurements could not be loaded
+
+    The attribute `errors` is a list of `(path, exception)` tuples,
+    one for each measurement that failed to load.
+    """
+    def __init__(self, errors):
+        self.errors = errors
+        msg = "Could not load {} measurement(s):".format(len(errors))
+        for path, exc in errors:
+            msg += "\n - {}: {}".format(path, exc)
+        super(MeasurementLoadError, self).__init__(msg)
+
+
 class MultipleValuesError(BaseException):
     pass
 
 
+#: memoized results of :func:`get_kde_spacing_doane`
+KDE_SPACING_CACHE = LRUCache(maxsize=10000)
+
+#: memoized results of :func:`get_statistics`
+STATISTICS_CACHE = LRUCache(maxsize=1000)
+
+
 class Analysis(object):
     """Stores several RT-DC data sets and useful methods
 
@@ -40,7 +66,7 @@ class Analysis(object):
      - Plotting parameters
     """
 
-    def __init__(self, data, config={}):
+    def __init__(self, data, config={}, workers=1, memory_budget=0):
         """ Analysis data object.
 
         Parameters
@@ -60,20 +86,64 @@ class Analysis(object):
             place at the end of the initialization of this class and
             the configuration must be applied beforehand to make
             sure that parameters such as "emodulus" are computed.
+        workers: int
+            Number of worker threads used for opening the measurement
+            files and for completing their configuration. Set to 1 to
+            do everything sequentially and to 0 to use as many workers
+            as there are CPUs.
+        memory_budget: int
+            Maximum size in bytes of the computed ancillary features
+            (e.g. "emodulus") held in memory by all measurements. The
+            least recently used features are evicted and recomputed
+            when needed again. Set to 0 for no limit.
+
+        Raises
+        ------
+        MeasurementLoadError: if one or more files could not be opened
+            with more than one worker (with one worker, the error of
+            the first file that could not be opened is raised)
         """
+        self.workers = workers
+        self.memory = MemoryBudget(maxbytes=memory_budget)
+        # Filter states of the measurements (see `_apply_filters`)
+        self._filter_states = {}
+        # Filter version counters of the measurements; incremented
+        # each time the filters of a measurement are applied.
+        self._filter_versions = {}
+        # Cached feature summaries (see `_get_feat_summary`)
+        self._feat_summaries = {}
+        # Cached concatenated features (see `get_feat_concat`)
+        self._feat_concat = {}
+        # Feature availability index (see `_get_feature_index`)
+        self._feature_index = None
+        # Plots showing data of this analysis (see `register_plot`)
+        self._plots = {}
         # Start importing measurements
         self.measurements = []
         if isinstance(data, list):
             # New analysis
             for dd in data:
-                if isinstance(dd, dclab.rtdc_dataset.RTDCBase):
-                    rtdc_ds = dd
-                elif (isinstance(dd, (str_classes, pathlib.Path)) and
-                      pathlib.Path(dd).exists()):
-                    rtdc_ds = dclab.new_dataset(dd)
-                else:
+                if not (isinstance(dd, dclab.rtdc_dataset.RTDCBase) or
+                        (isinstance(dd, (str_classes, pathlib.Path)) and
+                         pathlib.Path(dd).exists())):
                     raise ValueError("Data type not understood: {}".format(dd))
-                self.measurements.append(rtdc_ds)
+            if self.workers == 1:
+                measurements = []
+                for dd in data:
+                    if isinstance(dd, dclab.rtdc_dataset.RTDCBase):
+                        rtdc_ds = dd
+                    else:
+                        rtdc_ds = dclab.new_dataset(dd)
+                    measurements.append(rtdc_ds)
+                self.measurements = measurements
+            else:
+                # The order of `data` is preserved by `self._map`.
+                results = self._map(_load_measurement, data)
+                errors = [(dd, exc) for dd, (_, exc) in zip(data, results)
+                          if exc is not None]
+                if errors:
+                    raise MeasurementLoadError(errors)
+                self.measurements = [rtdc_ds for rtdc_ds, _ in results]
         else:
             raise ValueError("Argument not a list of files or " +
                              "measuremens: {}".format(data))
@@ -94,25 +164,35 @@ class Analysis(object):
     def __len__(self):
         return len(self.measurements)
 
+    @property
+    def measurements(self):
+        """List of RT-DC datasets (instances of RTDCBase)"""
+        return self._measurements
+
+    @measurements.setter
+    def measurements(self, value):
+        self._measurements = value
+        self._feature_index = None
+        for mm in value:
+            self.memory.register(mm)
+
     def _clear(self):
         """Remove all attributes from this instance, making it unusable
 
-        It is difficult to control how the chaco plots refer to a measurement
-        object.
-
+        The plots registered with `register_plot` are emptied, such
+        that they do not keep the data of the measurements alive.
         """
+        for key in list(self._plots.keys()):
+            for plot in list(self._plots.pop(key)):
+                _teardown_plot(plot)
         for _i in range(len(self.measurements)):
             mm = self.measurements.pop(0)
-            # Deleting all the data in measurements!
-            refs = gc.get_referrers(mm)
-            for r in refs:
-                if hasattr(r, "delplot"):
-                    r.delplot()
-                del r
+            self.memory.unregister(mm)
             del mm
+        self._feature_index = None
+        self._feat_concat = {}
         # Reset contour accuracies
         self.reset_plot_accuracies()
-        gc.collect()
 
     def _complete_config(self, measurements=None):
         """Complete configuration of all RT-DC datasets
@@ -129,30 +209,36 @@ class Analysis(object):
             cfgold = mm.config.copy()
             mm.config.update(get_default_config())
             mm.config.update(cfgold)
+
+        # These are identical for all measurements
+        axes = self.GetPlotAxes()
+        scales = self.GetPlotScales()
+        usable = self.get_usable_features()
+
+        def complete_accuracies(mm):
             # Sensible values for default contour accuracies
             # Use Doane's formula
-            defs = [["contour accuracy {}", self._doanes_formula_acc, 1/4],
-                    ["kde accuracy {}", self._doanes_formula_acc, 1/2],
+            defs = [["contour accuracy {}", 1/4],
+                    ["kde accuracy {}", 1/2],
                     ]
             pltng = mm.config["plotting"]
-            for kk, sc in zip(self.GetPlotAxes(), self.GetPlotScales()):
-                for d, l, mult in defs:
+            for kk, sc in zip(axes, scales):
+                for d, mult in defs:
                     var = d.format(kk)
                     if var not in pltng:
-                        acc = mm.get_kde_spacing(mm[kk],
-                                                 scale=sc,
-                                                 method=l,
-                                                 feat=kk)
+                        acc = get_kde_spacing_doane(mm, feat=kk, scale=sc)
                         # multiply by mult and
                         # round to make it look pretty in the GUI
                         accr = float("{:.1e}".format(acc * mult))
                         pltng[var] = accr
             # Check for missing min/max values and set them to zero
-            for item in self.get_usable_features():
+            for item in usable:
                 appends = [" min", " max"]
                 for a in appends:
-                    if item + a not in mm.config["plotting"]:
-                        mm.config["plotting"][item+a] = 0
+                    if item + a not in pltng:
+                        pltng[item+a] = 0
+
+        self._map(complete_accuracies, measurements)
 
     @staticmethod
     def _doanes_formula_acc(a):
@@ -171,8 +257,114 @@ class Analysis(object):
             acc = 1
         return acc
 
+    def _apply_filters(self):
+        """Apply the filters of measurements whose filter inputs changed
+
+        The filter inputs of each measurement (configuration, manual
+        filters, polygon filters, filtered events of the hierarchy
+        parent) are compared to those at the time the filters were
+        last applied via this method. Hierarchy parents are always
+        processed before their children, so that changes propagate
+        down a hierarchy.
+        """
+        for mm in sorted(self.measurements, key=_hierarchy_depth):
+            state = _get_filter_state(mm)
+            if self._filter_states.get(mm.identifier) != state:
+                with DATASET_LOCK:
+                    mm.apply_filter()
+                # The manual filter of a hierarchy child is updated
+                # when its filters are applied.
+                self._filter_states[mm.identifier] = _get_filter_state(mm)
+                self._filter_versions[mm.identifier] = \
+                    self._filter_versions.get(mm.identifier, 0) + 1
+
+    def _get_feature_index(self):
+        """Return the feature availability index of the measurements
+
+        The index is a dictionary with the keys
+
+        - "available": boolean array of shape (number of measurements,
+          number of scalar features) identifying the features
+          available in each measurement
+        - "usable": list of usable features (see `get_usable_features`)
+        - "unusable": list of unusable features
+
+        It is computed once and reset when measurements are added
+        or removed or when the "calculation" configuration changes.
+        """
+        if self._feature_index is None:
+            features = dfn.scalar_feature_names
+            ignored = get_ignored_features()
+            available = np.zeros((len(self.measurements), len(features)),
+                                 dtype=bool)
+            for ii, mm in enumerate(self.measurements):
+                for jj, ax in enumerate(features):
+                    available[ii, jj] = ax in mm
+            shared = np.all(available, axis=0)
+            usable = []
+            unusable = []
+            for ax, sh in zip(features, shared):
+                if sh and ax not in ignored:
+                    usable.append(ax)
+                else:
+                    unusable.append(ax)
+            self._feature_index = {"available": available,
+                                   "usable": usable,
+                                   "unusable": unusable}
+        return self._feature_index
+
+    def _get_feat_summary(self, mm, feature, filtered=True):
+        """Return summary statistics of a feature of a measurement
+
+        The summary is a dictionary with the keys "size", "min",
+        "max", and, computed from the logarithm of the positive
+        values, "log size", "log mean", and "log std". It is cached
+        until the filter version of the measurement changes.
+        """
+        version = self._filter_versions.get(mm.identifier, 0)
+        key = (mm.identifier, feature, filtered)
+        if key in self._feat_summaries:
+            cversion, summary = self._feat_summaries[key]
+            if cversion == version:
+                return summary
+        mmf = mm[feature]
+        if filtered:
+            mmf = mmf[mm.filter.all]
+        summary = {"size": mmf.size}
+        if mmf.size:  # prevent searching for min/max in empty array
+            summary["min"] = np.nanmin(mmf)
+            summary["max"] = np.nanmax(mmf)
+        # compute std and mean (nans are always False)
+        ld = np.log(mmf[mmf > 0])
+        summary["log size"] = ld.size
+        if ld.size:
+            summary["log mean"] = ld.mean()
+            summary["log std"] = ld.std()
+        self._feat_summaries[key] = (version, summary)
+        return summary
+
+    def _map(self, func, items):
+        """Apply `func` to all `items` using `self.workers` threads
+
+        The results are returned as a list in the order of `items`.
+        """
+        items = list(items)
+        workers = self.workers or mp.cpu_count()
+        workers = min(workers, len(items))
+        if workers <= 1:
+            return [func(it) for it in items]
+        pool = ThreadPool(processes=workers)
+        try:
+            results = pool.map(func, items)
+        finally:
+            pool.close()
+            pool.join()
+        return results
+
     def append(self, ds):
         self.measurements.append(ds)
+        self._feature_index = None
+        self.memory.register(ds)
 
     def ForceSameDataSize(self):
         """
@@ -194,6 +386,51 @@ class Analysis(object):
         self.SetParameters(cfgnew)
         return minsize
 
+    def get_feat_concat(self, feature, filtered=True):
+        """Return the feature data of all measurements as one array
+
+        The arrays are cached until the filters of a measurement
+        change (see `_apply_filters`) or the measurements are
+        reordered. Grouped reductions can be computed with
+        e.g. `np.bincount(index, weights=values)`.
+
+        Parameters
+        ----------
+        feature: str
+            Name of the feature
+        filtered: bool
+            If True, only include filtered events
+
+        Returns
+        -------
+        values: 1d ndarray
+            Concatenated feature data of all measurements (read-only)
+        index: 1d ndarray of int
+            Index of the measurement in `self.measurements` that each
+            entry in `values` belongs to (read-only)
+        """
+        state = [(mm.identifier, self._filter_versions.get(mm.identifier, 0))
+                 for mm in self.measurements]
+        key = (feature, filtered)
+        if key in self._feat_concat and self._feat_concat[key][0] == state:
+            _, values, index = self._feat_concat[key]
+        else:
+            vlist = []
+            ilist = []
+            for ii, mm in enumerate(self.measurements):
+                if filtered:
+                    data = mm[feature][mm.filter.all]
+                else:
+                    data = np.asarray(mm[feature])
+                vlist.append(data)
+                ilist.append(np.full(data.size, ii, dtype=int))
+            values = np.concatenate(vlist)
+            index = np.concatenate(ilist)
+            values.setflags(write=False)
+            index.setflags(write=False)
+            self._feat_concat[key] = (state, values, index)
+        return values, index
+
     def get_feat_range(self, feature, scale="linear", filtered=True,
                        update_config=True):
         """Return the current plotting range of a feature
@@ -274,12 +511,10 @@ class Analysis(object):
             rmin = np.inf
             rmax = -np.inf
             for mm in self.measurements:
-                mmf = mm[feature]
-                if filtered:
-                    mmf = mmf[mm.filter.all]
-                if mmf.size:  # prevent searching for min/max in empty array
-                    rmin = min(rmin, np.nanmin(mmf))
-                    rmax = max(rmax, np.nanmax(mmf))
+                summary = self._get_feat_summary(mm, feature, filtered)
+                if summary["size"]:
+                    rmin = min(rmin, summary["min"])
+                    rmax = max(rmax, summary["max"])
                 # check for logarithmic plots
                 if scale == "log":
                     if rmin <= 0:
@@ -287,10 +522,9 @@ class Analysis(object):
                             # fluorescence maxima data
                             rmin = 1
                         else:
-                            # compute std and mean (nans are always False)
-                            ld = np.log(mmf[mmf > 0])
-                            if len(ld):
-                                rmin = np.exp(ld.mean() - 2 * ld.std())
+                            if summary["log size"]:
+                                rmin = np.exp(summary["log mean"]
+                                              - 2 * summary["log std"])
                             else:
                                 # generic default
                                 rmin = .1
@@ -340,6 +574,42 @@ class Analysis(object):
             raise MultipleValuesError(msg)
         return mm.config[section][key]
 
+    def get_memory_usage(self):
+        """Return the memory used by feature data of each measurement
+
+        Returns
+        -------
+        usage: list of int
+            Size of the feature data held in memory in bytes
+            for each measurement (see
+            :func:`shapeout.util.memory.get_memory_usage`)
+        """
+        return [get_memory_usage(mm) for mm in self.measurements]
+
+    def get_plot_state(self, mm):
+        """Return the inputs of the plotted data of a measurement
+
+        Plots of a measurement only have to be updated if its plot
+        state changed since they were last drawn.
+
+        Parameters
+        ----------
+        mm: RTDCBase
+            Measurement of this analysis
+
+        Returns
+        -------
+        state: tuple
+            The filter version of the measurement (incremented each
+            time its filters are applied) and a hash of its
+            "plotting" configuration section; the plotting range
+            is not included (see :func:`Analysis.set_plot_range`).
+        """
+        version = self._filter_versions.get(mm.identifier, 0)
+        items = [it for it in sorted(mm.config["plotting"].items())
+                 if not _is_plot_range_key(it[0])]
+        return version, hashobj(repr(items))
+
     def get_unusable_features(self):
         """
         Unusable axes are axes that are not shared by all measurements
@@ -349,17 +619,7 @@ class Analysis(object):
         --------
         get_usable_features
         """
-        unusable = []
-        for ax in dfn.scalar_feature_names:
-            if ax in get_ignored_features():
-                unusable.append(ax)
-                continue
-            for mm in self.measurements:
-                # Get the attribute name for the axis
-                if ax not in mm:
-                    unusable.append(ax)
-                    break
-        return unusable
+        return list(self._get_feature_index()["unusable"])
 
     def get_usable_features(self):
         """
@@ -371,12 +631,7 @@ class Analysis(object):
         --------
         get_unusable_features
         """
-        unusable = self.get_unusable_features()
-        usable = []
-        for ax in dfn.scalar_feature_names:
-            if ax not in unusable:
-                usable.append(ax)
-        return usable
+        return list(self._get_feature_index()["usable"])
 
     def GetCommonParameters(self, key):
         """
@@ -431,12 +686,15 @@ class Analysis(object):
         Computes Mean, Avg, etc for all data sets and returns two lists:
         The headings and the values.
         """
-        datalist = []
-        head = None
-        for mm in self.measurements:
+        def compute(mm):
             features = [mm.config["plotting"]["axis x"].lower(),
                         mm.config["plotting"]["axis y"].lower()]
-            h, v = dclab.statistics.get_statistics(mm, features=features)
+            return get_statistics(mm, features=features)
+
+        datalist = []
+        head = None
+        results = self._map(compute, self.measurements)
+        for mm, (h, v) in zip(self.measurements, results):
             # Make sure all features are equal
             if head is not None:
                 assert head == h, "'{}' has wrong features!".format(mm.title)
@@ -511,6 +769,30 @@ class Analysis(object):
 
         return conf
 
+    def register_plot(self, plot, measurement=None):
+        """Register a plot that displays data of this analysis
+
+        Registered plots are emptied when the analysis is cleared.
+        Only weak references are stored, i.e. plots that are not
+        used anymore do not have to be unregistered.
+
+        Parameters
+        ----------
+        plot: chaco.api.Plot
+            The plot
+        measurement: RTDCBase or None
+            The measurement whose data are shown in the plot; set
+            to `None` if the plot shows data of several measurements
+            (e.g. the contour plot).
+        """
+        if measurement is None:
+            key = None
+        else:
+            key = measurement.identifier
+        if key not in self._plots:
+            self._plots[key] = weakref.WeakSet()
+        self._plots[key].add(plot)
+
     def reset_plot(self):
         self.reset_plot_accuracies()
         self.reset_plot_ranges()
@@ -586,6 +868,36 @@ class Analysis(object):
         for mm in self.measurements:
             mm.config[section][key] = value
 
+    def set_plot_range(self, plot_range):
+        """Set the plotting range of all measurements
+
+        In contrast to :func:`Analysis.SetParameters`, filters are
+        not checked and the configuration is not completed. This
+        method is meant for frequent updates of the plotting range
+        (e.g. while panning or zooming a plot).
+
+        Parameters
+        ----------
+        plot_range: dict
+            Plotting configuration keys "{feature} min" and
+            "{feature} max" with their values
+        """
+        plot_range = plot_range.copy()
+        for key in plot_range:
+            if not _is_plot_range_key(key):
+                raise ValueError("Not a plotting range key: '{}'".format(key))
+            feat, _, lim = key.rpartition(" ")
+            fmin = feat + " min"
+            fmax = feat + " max"
+            if (lim == "min" and fmax in plot_range and
+                    plot_range[fmin] > plot_range[fmax]):
+                msg = "inverting plot range: {} > {}".format(fmin, fmax)
+                warnings.warn(msg)
+                plot_range[fmin], plot_range[fmax] = \
+                    plot_range[fmax], plot_range[fmin]
+        for key in plot_range:
+            self.set_config_value("plotting", key, plot_range[key])
+
     def SetContourColors(self, colors=None):
         """ Sets the contour colors.
 
@@ -595,6 +907,10 @@ class Analysis(object):
         """
         if len(self.measurements) > 1:
             if colors is None or len(colors) < len(self.measurements):
+                # The colormap requires chaco; import it only here to
+                # keep the analysis core free of GUI dependencies.
+                import chaco.api as ca
+                from .gui.plot_common import darkjet
                 # set colors
                 colormap = darkjet(ca.DataRange1D(low=0, high=1),
                                    steps=len(self.measurements))
@@ -671,27 +987,69 @@ class Analysis(object):
                 upcfg["analysis"].pop(skey)
         if "calculation" in newcfg:
             upcfg["calculation"] = newcfg["calculation"].copy()
+            # ancillary features might become available
+            self._feature_index = None
 
         for mm in self.measurements:
             # update configuration
             mm.config.update(upcfg)
-        for mm in self.measurements:
-            # apply filter in separate loop (safer for hierarchies)
-            mm.apply_filter()
+        # apply filter in separate loop (safer for hierarchies); only
+        # measurements whose filter inputs changed are filtered again
+        self._apply_filters()
 
         # Trigger computation of kde/contour accuracies for ancillary features
         self._complete_config()
 
 
-def darkjet(myrange, **traits):
-    """Generator function for the 'darkjet' colormap. """
-    _data = {'red': ((0., 0, 0), (0.35, 0.0, 0.0), (0.66, .3, .3), (0.89, .4, .4),
-                     (1, 0.5, 0.5)),
-             'green': ((0., 0.0, 0.0), (0.125, .1, .10), (0.375, .4, .4), (0.64, .3, .3),
-                       (0.91, 0.2, 0.2), (1, 0, 0)),
-             'blue': ((0., 0.7, 0.7), (0.11, .5, .5), (0.34, .4, .4), (0.65, 0, 0),
-                      (1, 0, 0))}
-    return ColorMapper.from_segment_map(_data, range=myrange, **traits)
+def _get_filter_state(rtdc_ds):
+    """Return a hash of everything that determines `rtdc_ds.filter.all`
+
+    This includes all configuration sections except "analysis" and
+    "plotting" (ancillary features may depend on e.g. "calculation"
+    or "imaging"), the manual filter array, the polygon filters, and
+    for hierarchy children, the filtered events of the parent.
+    """
+    cfg = rtdc_ds.config
+    tohash = []
+    for sec in sorted(cfg.keys()):
+        if sec not in ["analysis", "plotting"]:
+            tohash.append(repr((sec, sorted(cfg[sec].items()))))
+    for pf_id in cfg["filtering"]["polygon filters"]:
+        try:
+            pf = dclab.PolygonFilter.get_instance_from_id(pf_id)
+        except KeyError:
+            tohash.append("missing polygon filter {}".format(pf_id))
+        else:
+            tohash.append(pf.hash)
+    tohash.append(np.packbits(rtdc_ds.filter.manual))
+    if rtdc_ds.format == "hierarchy":
+        tohash.append(np.packbits(rtdc_ds.hparent.filter.all))
+    return hashobj(tohash)
+
+
+def _is_plot_range_key(key):
+    """Return True if `key` is a "{feature} min/max" plotting key"""
+    feat, _, lim = key.rpartition(" ")
+    return lim in ["min", "max"] and feat in dfn.scalar_feature_names
+
+
+def _hierarchy_depth(rtdc_ds):
+    """Return the number of hierarchy parents of a dataset"""
+    depth = 0
+    while rtdc_ds.format == "hierarchy":
+        rtdc_ds = rtdc_ds.hparent
+        depth += 1
+    return depth
+
+
+def _teardown_plot(plot):
+    """Remove all renderers and data from a chaco plot"""
+    if hasattr(plot, "delplot"):
+        plot.delplot(*list(plot.plots.keys()))
+    data = getattr(plot, "data", None)
+    if hasattr(data, "del_data"):
+        for name in list(data.list_data()):
+            data.del_data(name)
 
 
 # TODO: (Python3)
@@ -703,6 +1061,58 @@ def get_default_config():
     return cfg
 
 
+def _load_measurement(data):
+    """Open a measurement, returning `(rtdc_ds, None)` or `(None, exc)`
+
+    Exceptions are returned instead of raised so that all files of
+    an analysis can be loaded (in parallel) before errors are reported.
+    """
+    if isinstance(data, dclab.rtdc_dataset.RTDCBase):
+        return data, None
+    try:
+        rtdc_ds = dclab.new_dataset(data)
+    except Exception as exc:
+        return None, exc
+    return rtdc_ds, None
+
+
+def get_statistics(rtdc_ds, features, methods=None):
+    """Cached version of :func:`dclab.statistics.get_statistics`
+
+    The cache key consists of the feature data, the current filter,
+    the setup configuration (e.g. "flow rate"), and the methods.
+    """
+    key = hashobj([[get_feature_key(rtdc_ds, ft) for ft in features],
+                   get_filter_fingerprint(rtdc_ds),
+                   repr(sorted(rtdc_ds.config["setup"].items())),
+                   methods])
+    if key not in STATISTICS_CACHE:
+        h, v = dclab.statistics.get_statistics(rtdc_ds,
+                                               methods=methods,
+                                               features=features)
+        STATISTICS_CACHE[key] = (h, v)
+    h, v = STATISTICS_CACHE[key]
+    return list(h), list(v)
+
+
+def get_kde_spacing_doane(rtdc_ds, feat, scale="linear"):
+    """Return the (memoized) Doane's formula bin width of a feature
+
+    The bin width is computed from all events of `rtdc_ds` (not only
+    the filtered ones) and cached in :const:`KDE_SPACING_CACHE` using
+    the dataset/feature hash and the scale as a key. It is the basis
+    for the default contour and kde accuracies.
+    """
+    key = (get_feature_key(rtdc_ds, feat), scale)
+    if key not in KDE_SPACING_CACHE:
+        acc = rtdc_ds.get_kde_spacing(rtdc_ds[feat],
+                                      scale=scale,
+                                      method=Analysis._doanes_formula_acc,
+                                      feat=feat)
+        KDE_SPACING_CACHE[key] = acc
+    return KDE_SPACING_CACHE[key]
+
+
 def remove_nan_inf(x):
     for issome in [np.isnan, np.isinf]:
         xsome = issome(x)
@@ -12,8 +12,6 @@ import dclab
 from dclab.rtdc_dataset import config as rt_config
 
 from . import confparms
-from . import plot_contour
-from . import plot_scatter
 
 from .controls_analyze import SubPanelAnalyze
 from .controls_calculate import SubPanelCalculate
@@ -146,16 +144,7 @@ class ControlPanel(ScrolledPanel):
             # Only update the plotting data.
             # (Until version 0.6.1 the plots were recreated after
             #  each update, which caused a memory leak)
-            plot_window = self.frame.PlotArea.mainplot.plot_window
-            plots = plot_window.component.components
-            for plot in plots:
-                for mm in self.analysis.measurements:
-                    if plot.id == mm.identifier:
-                        plot_scatter.set_scatter_data(plot, mm)
-                        plot_scatter.reset_inspector(plot)
-    
-                if plot.id == "ShapeOut_contour_plot":
-                    plot_contour.set_contour_data(plot, self.analysis.measurements)
+            self.frame.PlotArea.mainplot.UpdatePlotData()
         
         if updp:
             self.UpdatePages()
@@ -4,6 +4,7 @@ from __future__ import unicode_literals
 
 import io
 import dclab
+import numpy as np
 import tempfile
 import webbrowser
 import wx
@@ -205,13 +206,18 @@ class SubPanelAnalyze(SubPanel):
 
         model = self.WXCB_model.GetValue()
         self.analysis.SetParameters({"analysis":{"regression model":model}})
-        
+
+        # filtered data of all measurements
+        values, index = self.analysis.get_feat_concat(axname)
+        sizes = np.bincount(index, minlength=len(self.analysis))
+        mmvalues = np.split(values, np.cumsum(sizes)[:-1])
+
         for ii, mm in enumerate(self.analysis.measurements):
             # get treatment (ignore 0)
             if self.WXCB_treatment[ii].GetSelection() == 0:
                 # The user selected "None"
                 continue
-            xs.append(mm[axname][mm.filter.all])
+            xs.append(mmvalues[ii])
             mmtreat = self.WXCB_treatment[ii].GetValue()
             treatment.append(mmtreat)
             # get repetition
@@ -120,8 +120,11 @@ class SubPanelPlotContour(SubPanel):
         
         axes = analysis.GetPlotAxes()
         self.BindEnableName(ctrl_source="kde",
-                            value=["multivariate", "histogram"],
+                            value=["fft", "multivariate", "histogram", "tree"],
                             ctrl_targets=["kde accuracy {}".format(a) for a in axes])
+        self.BindEnableName(ctrl_source="kde",
+                            value=["tree"],
+                            ctrl_targets=["kde tolerance"])
         self.SetSizer(sizer)
         sizer.Fit(self)
 
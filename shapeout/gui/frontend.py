@@ -19,6 +19,7 @@ import dclab
 
 
 from .. import analysis
+from .. import kde
 from ..settings import SettingsFile
 from .. import meta_tool
 
@@ -306,6 +307,10 @@ class Frame(gaugeframe.GaugeFrame):
                                                    "&Expert mode",
                                 "Enable advanced functionalities")
         self.menuExpert.Check(self.config.get_bool("expert mode"))
+        self.menuProgressive = prefMenu.AppendCheckItem(wx.ID_ANY,
+                                                   "&Progressive plotting",
+                    "Show preliminary plots while computing the densities")
+        self.menuProgressive.Check(self.config.get_bool("plot progressive"))
         for item in prefMenu.GetMenuItems():
             self.Bind(wx.EVT_MENU, self.OnMenuPreferences, item)
         
@@ -397,12 +402,17 @@ class Frame(gaugeframe.GaugeFrame):
                     pass
             # Remember contour colors
             contour_colors = self.analysis.GetContourColors()
+            # the plotting range of the old analysis is not needed anymore
+            self.PlotArea.StopRangeTimer()
             self.analysis._clear()
         else:
             contour_colors = None
 
         # Set Analysis
-        anal = analysis.Analysis(data, config=newcfg)
+        budget = self.config.get_int("analysis memory budget mb") * 1024**2
+        anal = analysis.Analysis(data, config=newcfg,
+                                 workers=self.config.get_int("analysis workers"),
+                                 memory_budget=budget)
         # Reset plotting parameters
         anal.reset_plot()
         # Set previous contour colors
@@ -564,6 +574,8 @@ class Frame(gaugeframe.GaugeFrame):
             display_name = "Expert mode"
         elif eid == self.menuSearchUpdate.Id:
             self.config.set_bool("check update", val)
+        elif eid == self.menuProgressive.Id:
+            self.config.set_bool("plot progressive", val)
         else:
             raise ValueError("Unknown preferences event!")
 
@@ -580,6 +592,46 @@ class Frame(gaugeframe.GaugeFrame):
             dlg.Destroy()
 
 
+    def SearchData(self, path, add=False, marked=[]):
+        """Search for measurements and display them in PanelLeft
+
+        The measurement tree is updated progressively while the
+        directories are scanned (see `meta_tool.iter_data_tree`).
+
+        Parameters
+        ----------
+        path: str or list of str
+            Directories to search
+        add: bool
+            If True, the measurements are added to the current tree.
+        marked: list
+            Measurements to display in bold
+        """
+        if add:
+            base = list(self.PanelLeft.treelist)
+        else:
+            base = []
+        self.GaugeStreamStart(
+                        func=meta_tool.iter_data_tree,
+                        func_args=(path,),
+                        post_call=self.OnSearchDataResult,
+                        post_call_kwargs={"base": base, "marked": marked},
+                        msg="Searching for data files"
+                        )
+
+
+    def OnSearchDataResult(self, data, base=[], marked=[]):
+        """Display (partial) results of `meta_tool.iter_data_tree`
+
+        The tree is replaced with the new results; the projects in
+        `base` that were not found again are kept.
+        """
+        treelist, cols = data
+        treelist += [item for item in base if item not in treelist]
+        self.PanelLeft.SetProjectTree((treelist, cols), add=False,
+                                      marked=list(marked))
+
+
     def OnMenuSearchPath(self, e=None):
         """ Set path of working directory
         
@@ -593,12 +645,7 @@ class Frame(gaugeframe.GaugeFrame):
             path = dlg.GetPath().encode("utf-8")
             self.config.set_path(path, name="MeasurementList")
             dlg.Destroy()
-            self.GaugeIndefiniteStart(
-                                func=meta_tool.collect_data_tree,
-                                func_args=(path,),
-                                post_call=self.PanelLeft.SetProjectTree,
-                                msg="Searching for data files"
-                                )
+            self.SearchData(path)
 
 
     def OnMenuSearchPathAdd(self, e=None, add=True, path=None,
@@ -613,13 +660,7 @@ class Frame(gaugeframe.GaugeFrame):
             dlg.Destroy()
             if answer != wx.ID_OK:
                 return
-        self.GaugeIndefiniteStart(
-                        func=meta_tool.collect_data_tree,
-                        func_args=(path,),
-                        post_call=self.PanelLeft.SetProjectTree,
-                        post_call_kwargs = {"add":add, "marked":marked},
-                        msg="Searching for data files"
-                        )
+        self.SearchData(path, add=add, marked=marked)
 
     def OnMenuQuit(self, e=None):
         if hasattr(self, "analysis") and self.analysis is not None:
@@ -645,6 +686,10 @@ class Frame(gaugeframe.GaugeFrame):
                 os.remove(autosave.autosave_file)
         except:
             pass
+        self.PlotArea.StopRangeTimer()
+        # `os._exit` does not call the `atexit` functions
+        kde.close_pool()
+        meta_tool.flush_indexes()
         os._exit(0)
 
 
@@ -108,6 +108,48 @@ class WorkerThread(td.Thread):
 
 
 
+########################################################################
+class StreamWorkerThread(td.Thread):
+    """Worker thread for generator functions"""
+    def __init__(self, notify_window, generator, func_args,
+                 post_call, post_call_kwargs, worker_id=8472):
+        """Iterate over a generator in a thread
+
+        Every value yielded by `generator(*func_args)` is passed to
+        `post_call` in the main thread. In contrast to `WorkerThread`,
+        the generator runs in this process (use this for functions
+        that wait for I/O).
+        """
+        td.Thread.__init__(self)
+        self.daemon = True
+        self._notify_window = notify_window
+        self._generator = generator
+        self._func_args = func_args
+        self._post_call = post_call
+        self._post_call_kwargs = post_call_kwargs
+        self._worker_id = worker_id
+        self._abort = td.Event()
+        self.start()
+
+    def run(self):
+        """Run Worker Thread."""
+        gen = self._generator(*self._func_args)
+        try:
+            for res in gen:
+                if self._abort.is_set():
+                    break
+                wx.CallAfter(self._notify_window._OnStreamResult,
+                             self, res)
+        finally:
+            gen.close()
+            wx.CallAfter(self._notify_window._OnStreamDone, self)
+
+    def abort(self):
+        """abort worker thread."""
+        self._abort.set()
+
+
+
 ########################################################################
 class GaugeFrame(wx.Frame):
     """Class MainFrame."""
@@ -219,6 +261,28 @@ class GaugeFrame(wx.Frame):
                                               )
 
 
+    def GaugeStreamStart(self, func, func_args=(), post_call=None,
+                         post_call_kwargs={}, msg="", worker_id=8472):
+        """Start a generator function in a thread (worker)
+
+        Same as `GaugeIndefiniteStart`, except that `func` is a
+        generator function and `post_call` is called for every
+        value it yields (e.g. for displaying partial results).
+        """
+        if self.workers.has_key(worker_id):
+            self.GaugeIndefiniteStop(worker_id=worker_id)
+        self.gauge.Show()
+        self.Bind(wx.EVT_TIMER, self._TimerHandler)
+        self._timer.Start(200)
+        self.workers[worker_id] = StreamWorkerThread(
+                                          self,
+                                          generator=func,
+                                          func_args=func_args,
+                                          post_call=post_call,
+                                          post_call_kwargs=post_call_kwargs,
+                                          worker_id=worker_id)
+
+
     def GaugeIndefiniteStop(self, event=None, worker_id=8472):
         """ Abort computation of a worker
         
@@ -266,6 +330,20 @@ class GaugeFrame(wx.Frame):
                 print("Computation aborted")
 
 
+    def _OnStreamResult(self, worker, res):
+        """Pass a value yielded in a `StreamWorkerThread` on"""
+        if self.workers.get(worker._worker_id) is worker:
+            # not aborted
+            if callable(worker._post_call):
+                worker._post_call(res, **worker._post_call_kwargs)
+
+
+    def _OnStreamDone(self, worker):
+        """Stop the gauge of a finished `StreamWorkerThread`"""
+        if self.workers.get(worker._worker_id) is worker:
+            self.GaugeIndefiniteStop(worker_id=worker._worker_id)
+
+
     def _TimerHandler(self, event):
         """Keep the gauge pulsing"""
         ## TODO
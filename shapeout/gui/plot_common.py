@@ -8,11 +8,26 @@ from pkg_resources import resource_filename
 import warnings
 
 import chaco
-import dclab
+from chaco.color_mapper import ColorMapper
 import numpy as np
 
 from dclab import isoelastics
 
+from ..util.cache import LRUCache
+
+
+#: number of events used for preliminary plots (progressive plotting)
+PREVIEW_EVENTS = 500
+#: coarsening factor of the contour accuracy for preliminary contours
+PREVIEW_COARSENING = 2
+
+#: isoelasticity lines shared by all plots (see :func:`get_isoelastics`)
+ISOELASTICS_CACHE = LRUCache(maxsize=50)
+#: isoelasticity line sources (see :func:`get_default_isoelastics`
+#: and :func:`get_legacy_isoelastics`)
+_DEFAULT_ISOELASTICS = None
+_LEGACY_ISOELASTICS = None
+
 
 class MyTickGenerator(chaco.ticks.AbstractTickGenerator):
     """ An implementation of AbstractTickGenerator that simply uses the
@@ -29,66 +44,93 @@ class MyTickGenerator(chaco.ticks.AbstractTickGenerator):
                                               interval, use_endpoints=False), np.float64)
 
 
+def darkjet(myrange, **traits):
+    """Generator function for the 'darkjet' colormap. """
+    _data = {'red': ((0., 0, 0), (0.35, 0.0, 0.0), (0.66, .3, .3), (0.89, .4, .4),
+                     (1, 0.5, 0.5)),
+             'green': ((0., 0.0, 0.0), (0.125, .1, .10), (0.375, .4, .4), (0.64, .3, .3),
+                       (0.91, 0.2, 0.2), (1, 0, 0)),
+             'blue': ((0., 0.7, 0.7), (0.11, .5, .5), (0.34, .4, .4), (0.65, 0, 0),
+                      (1, 0, 0))}
+    return ColorMapper.from_segment_map(_data, range=myrange, **traits)
+
+
 def get_isoelastics(mm):
+    """Return the isoelasticity lines for the scatter plot of `mm`
+
+    The lines are computed once for each combination of
+    isoelasticity type, channel width, axes, and pixel size and
+    are shared by all plots (do not modify the returned arrays).
+
+    Returns
+    -------
+    isoel: list of 2d ndarrays or None
+        Isoelasticity lines or None if not shown or not available
+    """
     isotype = mm.config["plotting"]["isoelastics"]
     xax = mm.config["plotting"]["axis x"].lower()
     yax = mm.config["plotting"]["axis y"].lower()
     if isotype == "not shown":
         # nothing to do
-        isoel = None
+        return None
+    elif "legacy" in isotype:
+        px_um = None
     else:
-        if "legacy" in isotype:
-            method = "analytical"
-            isosource = legacy_isoelastics
-            add_px_err = False
-            px_um = None
-        else:
-            method = isotype
-            isosource = isoelastics.get_default()
-            add_px_err = True
-            px_um = mm.config["imaging"]["pixel size"]
-        kwargs = dict(method=method,
-                      channel_width=mm.config["setup"]["channel width"],
-                      flow_rate=None,
-                      viscosity=None,
-                      col1=xax,
-                      col2=yax,
-                      add_px_err=add_px_err,
-                      px_um=px_um,
-                      )
-        try:
-            isoel = isosource.get(**kwargs)
-        except KeyError:
-            warnings.warn("Could not find matching isoelastics for"+
-                          " Setting: x={}, y={}, method: {}".
-                          format(xax, yax, kwargs["method"]))
-            isoel = None
+        px_um = mm.config["imaging"]["pixel size"]
+    key = (isotype, mm.config["setup"]["channel width"], xax, yax, px_um)
+    if key not in ISOELASTICS_CACHE:
+        ISOELASTICS_CACHE[key] = _compute_isoelastics(*key)
+    return ISOELASTICS_CACHE[key]
+
+
+def _compute_isoelastics(isotype, channel_width, xax, yax, px_um):
+    if "legacy" in isotype:
+        method = "analytical"
+        isosource = get_legacy_isoelastics()
+        add_px_err = False
+    else:
+        method = isotype
+        isosource = get_default_isoelastics()
+        add_px_err = True
+    kwargs = dict(method=method,
+                  channel_width=channel_width,
+                  flow_rate=None,
+                  viscosity=None,
+                  col1=xax,
+                  col2=yax,
+                  add_px_err=add_px_err,
+                  px_um=px_um,
+                  )
+    try:
+        isoel = isosource.get(**kwargs)
+    except KeyError:
+        warnings.warn("Could not find matching isoelastics for"+
+                      " Setting: x={}, y={}, method: {}".
+                      format(xax, yax, kwargs["method"]))
+        isoel = None
     return isoel
 
 
-def get_kde_kwargs(x, y, kde_type, xacc, yacc, xscale, yscale):
-    """Copmutes optimal default KDE kwargs"""
-    kde_kwargs = {}
-    if kde_type == "multivariate":
-        kde_kwargs["bw"] = [xacc, yacc]
-    elif kde_type == "histogram":
-        # scale the x and y axes (fixes #264)
-        x = dclab.rtdc_dataset.RTDCBase._apply_scale(x, xscale, "x")
-        y = dclab.rtdc_dataset.RTDCBase._apply_scale(y, yscale, "y")
-        # The histogram accuracy is scaled by 1.8 to approximately
-        # match the multivariate kde.
-        try:
-            binx = naninfminmaxdiff(x)/(1.8*xacc)
-        except:
-            binx = 5
-        try:
-            biny = naninfminmaxdiff(y)/(1.8*yacc)
-        except:
-            biny = 5
-        binx = int(max(5, binx))
-        biny = int(max(5, biny))
-        kde_kwargs["bins"] = [binx, biny]
-    return kde_kwargs
+def get_default_isoelastics():
+    """Return dclab's default isoelasticity lines (loaded only once)"""
+    global _DEFAULT_ISOELASTICS
+    if _DEFAULT_ISOELASTICS is None:
+        _DEFAULT_ISOELASTICS = isoelastics.get_default()
+    return _DEFAULT_ISOELASTICS
+
+
+def get_legacy_isoelastics():
+    """Return the legacy isoelasticity lines (loaded only once)
+
+    The legacy lines are not part of dclab.
+    """
+    global _LEGACY_ISOELASTICS
+    if _LEGACY_ISOELASTICS is None:
+        data_dir = resource_filename("shapeout", "data")
+        iso_file = os.path.join(data_dir,
+                                "isoel-analytical-area_um-deform_legacy.txt")
+        _LEGACY_ISOELASTICS = isoelastics.Isoelastics([iso_file])
+    return _LEGACY_ISOELASTICS
 
 
 def my_log_auto_ticks(data_low, data_high,
@@ -115,15 +157,3 @@ def my_log_auto_ticks(data_low, data_high,
 
     return 10**expticks
 
-
-def naninfminmaxdiff(x):
-    bad = np.isnan(x) | np.isinf(x)
-    x = x[~bad]
-    diff = (x.max()-x.min())
-    return diff
-
-
-# Load legacy isoelasticity lines (not part of dclab)
-data_dir = resource_filename("shapeout", "data")
-iso_file = os.path.join(data_dir, "isoel-analytical-area_um-deform_legacy.txt")
-legacy_isoelastics = isoelastics.Isoelastics([iso_file])
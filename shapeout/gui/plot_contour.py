@@ -3,19 +3,19 @@
 """Shape-Out - contour plot methods"""
 from __future__ import division, unicode_literals
 
-import time
-
 import chaco.api as ca
 import chaco.tools.api as cta
 from dclab import definitions as dfn
-from dclab import kde_contours
 import numpy as np
 
 from . import plot_common
 from .. import analysis as ana
+from .. import kde
+from ..util.cache import DATASET_LOCK
 
 
-def contour_plot(analysis, axContour=None, wxtext=False, square=True):
+def contour_plot(analysis, axContour=None, wxtext=False, square=True,
+                 preview=False, workers=1):
     """Plot contour for two axes of an RT-DC measurement
     
     Parameters
@@ -26,6 +26,10 @@ def contour_plot(analysis, axContour=None, wxtext=False, square=True):
         Plotting axis for the contour.
     square : bool
         The plot has square shape.
+    preview : bool
+        Only plot preliminary contours (see :func:`get_contour_kwargs`)
+    workers : int
+        Number of worker processes (see :func:`compute_contour_data`)
     """
     mm = analysis[0]
     xax = mm.config["plotting"]["axis x"].lower()
@@ -64,7 +68,8 @@ def contour_plot(analysis, axContour=None, wxtext=False, square=True):
                                   value_scale=scaley)
     #colors = [ "".join(map(chr, np.array(c[:3]*255,dtype=int))).encode('hex') for c in colors ]
 
-    set_contour_data(contour_plot, analysis)
+    set_contour_data(contour_plot, analysis, preview=preview,
+                     workers=workers)
 
     # Axes
     left_axis = ca.PlotAxis(contour_plot, orientation='left',
@@ -107,9 +112,25 @@ def contour_plot(analysis, axContour=None, wxtext=False, square=True):
     return contour_plot
 
 
-def set_contour_data(plot, analysis):
-    pd = plot.data
-    # Plotting area
+def get_contour_kwargs(analysis, preview=False):
+    """Keyword arguments for :func:`shapeout.kde.compute_contours`
+
+    Parameters
+    ----------
+    analysis: shapeout.analysis.Analysis
+        Analysis with the measurements to compute contours for
+    preview: bool
+        Compute preliminary contours using a histogram density of at
+        most :data:`plot_common.PREVIEW_EVENTS` events of each
+        measurement on a coarse grid (progressive plotting)
+
+    Returns
+    -------
+    measurements: list of RTDCBase
+        Measurements for which contours can be computed
+    kwargs_list: list of dicts
+        Keyword arguments for each measurement
+    """
     mm = analysis[0]
     xax = mm.config["plotting"]["axis x"].lower()
     yax = mm.config["plotting"]["axis y"].lower()
@@ -117,46 +138,144 @@ def set_contour_data(plot, analysis):
     scalex = mm.config["plotting"]["scale x"].lower()
     scaley = mm.config["plotting"]["scale y"].lower()
 
+    measurements = []
+    kwargs_list = []
+    for mm in analysis:
+        # The data and the binning must belong to the same filter.
+        with DATASET_LOCK:
+            # Check if there is data to compute a contour from
+            if len(mm.filter.all)==0 or np.sum(mm.filter.all)==0:
+                break
+            pl = mm.config["plotting"]
+            kw = {"x": mm[xax][mm.filter.all],
+                  "y": mm[yax][mm.filter.all],
+                  "xax": xax,
+                  "yax": yax,
+                  "xscale": scalex,
+                  "yscale": scaley,
+                  "kde_type": pl["kde"].lower(),
+                  "kde_acc": (pl["kde accuracy "+xax],
+                              pl["kde accuracy "+yax]),
+                  # Accuracy for plotting contour data
+                  "contour_acc": (pl["contour accuracy "+xax],
+                                  pl["contour accuracy "+yax]),
+                  "levels": [pl["contour level 1"], pl["contour level 2"]],
+                  "mode": pl["contour level mode"],
+                  "kde_rtol": pl["kde tolerance"],
+                  }
+            if kw["kde_type"] == "histogram" and not preview:
+                # the binning is shared with the scatter plot
+                kw["binning"] = kde.get_histogram_binning(
+                    mm,
+                    xax=xax,
+                    yax=yax,
+                    xacc=kw["kde_acc"][0],
+                    yacc=kw["kde_acc"][1],
+                    xscale=scalex,
+                    yscale=scaley)
+            elif preview:
+                step = int(np.ceil(kw["x"].size / plot_common.PREVIEW_EVENTS))
+                kw["x"] = kw["x"][::step]
+                kw["y"] = kw["y"][::step]
+                kw["kde_type"] = "histogram"
+                kw["contour_acc"] = tuple([acc * plot_common.PREVIEW_COARSENING
+                                           for acc in kw["contour_acc"]])
+            kwargs_list.append(kw)
+            measurements.append(mm)
+    return measurements, kwargs_list
+
+
+def compute_contour_data(analysis, preview=False, workers=1):
+    """Compute the contours of all measurements of an analysis
+
+    This function does not access any plot and can thus be called
+    from a background thread.
+
+    Parameters
+    ----------
+    analysis: shapeout.analysis.Analysis
+        Analysis with the measurements
+    preview: bool
+        Passed to :func:`get_contour_kwargs`
+    workers: int
+        Number of worker processes (see
+        :func:`shapeout.kde.compute_contours_parallel`); the
+        default is to compute all contours in the current process.
+
+    Returns
+    -------
+    measurements: list of RTDCBase
+        Measurements for which contours were computed
+    kwargs_list: list of dicts
+        Keyword arguments of :func:`shapeout.kde.compute_contours`
+    contours_list: list
+        Return values of :func:`shapeout.kde.compute_contours`
+    """
+    measurements, kwargs_list = get_contour_kwargs(analysis, preview=preview)
+    contours_list = kde.compute_contours_parallel(kwargs_list,
+                                                  workers=workers)
+    return measurements, kwargs_list, contours_list
+
+
+def set_contour_data(plot, analysis, results=None, preview=False,
+                     workers=1):
+    """Compute the contours of all measurements and add them to `plot`
+
+    The contours are computed with :func:`compute_contour_data`.
+    Contours that were previously added to `plot` are removed.
+
+    Parameters
+    ----------
+    plot: chaco.api.Plot
+        Contour plot
+    analysis: shapeout.analysis.Analysis
+        Analysis with the measurements
+    results: tuple or None
+        Already computed contours, i.e. the tuple `(measurements,
+        kwargs_list, contours_list)` returned by
+        :func:`compute_contour_data`
+    preview: bool
+        Passed to :func:`get_contour_kwargs` if `results` is None
+    workers: int
+        Passed to :func:`compute_contour_data` if `results` is None
+
+    Returns
+    -------
+    timings: list of dict
+        Computation times of each measurement (see
+        :func:`shapeout.kde.compute_contours`) with the additional
+        keys "identifier" and "events"
+    """
+    pd = plot.data
+    if results is None:
+        results = compute_contour_data(analysis, preview=preview,
+                                       workers=workers)
+    measurements, kwargs_list, contours_list = results
+
+    # Remove previous contours
+    for name in list(plot.plots.keys()):
+        if name.startswith("contour_"):
+            plot.delplot(name)
+    for key in pd.list_data():
+        if key.startswith("contour_"):
+            pd.del_data(key)
+
+    mm = analysis[0]
+    scalex = mm.config["plotting"]["scale x"].lower()
+    scaley = mm.config["plotting"]["scale y"].lower()
+
     plot.index_scale = scalex
     plot.value_scale = scaley
 
-    for ii, mm in enumerate(analysis):
-
-        x0 = mm[xax][mm.filter.all]
-        y0 = mm[yax][mm.filter.all]
-
-        # Check if there is data to compute a contour from
-        if len(mm.filter.all)==0 or np.sum(mm.filter.all)==0:
-            break
-
-        kde_type = mm.config["plotting"]["kde"].lower()
-        kde_kwargs = plot_common.get_kde_kwargs(
-            x=x0,
-            y=y0,
-            xscale=scalex,
-            yscale=scaley,
-            kde_type=kde_type,
-            xacc=mm.config["plotting"]["kde accuracy "+xax],
-            yacc=mm.config["plotting"]["kde accuracy "+yax])
-        # Accuracy for plotting contour data
-        xacc = mm.config["plotting"]["contour accuracy "+xax]
-        yacc = mm.config["plotting"]["contour accuracy "+yax]
-
-        a = time.time()
-        X, Y, density = mm.get_kde_contour(xax=xax,
-                                           yax=yax,
-                                           xacc=xacc,
-                                           yacc=yacc,
-                                           xscale=scalex,
-                                           yscale=scaley,
-                                           kde_type=kde_type,
-                                           kde_kwargs=kde_kwargs,
-                                           )
-
-        if X.shape[0] == 1 or X.shape[1] == 1:
-            raise ValueError("Please decrease value for contour accuracy!")
-
-        print("...KDE contour time {}: {:.2f}s".format(kde_type, time.time()-a))
+    timings = []
+    for mm, kw, (contours, timing) in zip(measurements, kwargs_list,
+                                          contours_list):
+        kde.log_timing("KDE contour {}".format(kw["kde_type"]),
+                       mm.identifier, kw["x"].size, timing)
+        timing = dict(timing)
+        timing["identifier"] = mm.identifier
+        timing["events"] = kw["x"].size
+        timings.append(timing)
 
         # contour widths
         if "contour width" in mm.config["plotting"]:
@@ -164,30 +283,9 @@ def set_contour_data(plot, analysis):
         else:
             cwidth = 1.2
 
-        levels = np.array([mm.config["plotting"]["contour level 1"],
-                           mm.config["plotting"]["contour level 2"]])
-        mode = mm.config["plotting"]["contour level mode"]
-        if mode == "fraction":
-            plev = levels
-        elif mode == "quantile":
-            plev = kde_contours.get_quantile_levels(density,
-                                                    x=X,
-                                                    y=Y,
-                                                    xp=x0,
-                                                    yp=y0,
-                                                    q=levels,
-                                                    normalize=True)
-        else:
-            raise ValueError("Unknown contour level mode `{}`!".format(mode))
-
         styles = ["dot", "solid"]
         widths = [cwidth*.7, cwidth] # make outer lines slightly smaller
 
-        contours = []
-        for level in plev:
-            cc = kde_contours.find_contours_level(density, x=X, y=Y, level=level)
-            contours.append(cc)
-
         for ii, cc in enumerate(contours):
             for jj, cci in enumerate(cc):
                 x_key = "contour_x_{}_{}_{}".format(mm.identifier, ii, jj)
@@ -195,9 +293,12 @@ def set_contour_data(plot, analysis):
                 pd.set_data(x_key, cci[:,0])
                 pd.set_data(y_key, cci[:,1])
                 plot.plot((x_key, y_key),
+                           name="contour_{}_{}_{}".format(mm.identifier,
+                                                          ii, jj),
                            line_style=styles[ii],
                            line_width=widths[ii],
                            color=mm.config["plotting"]["contour color"],
                            index_scale=scalex,
                            value_scale=scaley,
                            )
+    return timings
@@ -3,6 +3,8 @@
 """Shape-Out - wx and chaco plot components"""
 from __future__ import division, print_function, unicode_literals
 
+import functools
+
 import chaco.api as ca
 import enable.api as ea
 
@@ -11,10 +13,19 @@ import platform
 import wx
 import wx.lib.agw.flatnotebook as fnb
 
+from .. import kde
+from ..util.progressive import Refiner
 from . import plot_scatter
 from . import plot_contour
 from . import plot_legend
 
+
+#: delay [ms] after the last zoom or pan step before the plotting
+#: range is stored and the level of detail of the scatter plots
+#: is updated
+PLOT_RANGE_DELAY = 250
+
+
 class PlotNotebook(fnb.FlatNotebook):
     """
     Flatnotebook class
@@ -57,6 +68,12 @@ class PlotPanel(wx.Panel):
         """
         self.mainplot.Plot(anal)
 
+    def StopRangeTimer(self):
+        """
+        convenience function that calls MainPlotArea.StopRangeTimer
+        """
+        self.mainplot.StopRangeTimer()
+
 
 class MainPlotArea(wx.Panel):
     def __init__(self, parent, frame):
@@ -72,16 +89,65 @@ class MainPlotArea(wx.Panel):
         
         self.container = None
         self.scatter2measure = {}
+        # dictionary mapping measurement identifiers to scatter plots
+        self.id2plot = {}
+        self.contour_plot = None
+        # plot states of the displayed data (see `UpdatePlotData`)
+        self.plot_states = {}
+        # plots with preliminary data and their measurements
+        self._unrefined = {}
+        # replaces preliminary plot data in the background
+        self.refiner = Refiner(deliver=wx.CallAfter)
+        # level of detail of zoomed scatter plots
+        self.lod_refiner = Refiner(deliver=wx.CallAfter)
+        self.viewport = None
+        # plotting range store (see `OnPlotRangeChanged`)
+        self.plot_range = {}
+        self.visible_range = None
+        self._range_timer = None
+
+    def GetPreview(self, mm=None):
+        """Return True if preliminary data should be plotted first
+
+        Parameters
+        ----------
+        mm: RTDCBase or None
+            Measurement of a scatter plot; set to None for the
+            contour plot.
+        """
+        if not self.frame.config.get_bool("plot progressive"):
+            return False
+        elif mm is None:
+            return True
+        else:
+            return not plot_scatter.is_scatter_data_cached(
+                mm, viewport=self.viewport)
+
+    def GetContourWorkers(self):
+        """Return the number of processes for computing contours"""
+        return self.frame.config.get_int("plot contour workers")
 
     def Plot(self, anal=None):
         self._lastplot = -1
         self._lastselect = -1
         self._lasthover = -1
+
+        # Do not refine plots that are about to be removed
+        self.refiner.cancel()
+        self.lod_refiner.cancel()
+        self._unrefined = {}
+        # the plotting range is reset below
+        self.viewport = None
+        # store the pending plotting range unless the analysis is replaced
+        self.StopRangeTimer(store=anal is None or anal is self.analysis)
         
         if anal is None:
             anal = self.analysis
         
         self.analysis = anal
+        # keep the cached plot data of all measurements
+        kde.set_cache_size(len(anal))
+        plot_scatter.set_cache_size(len(anal))
 
         # Determine the min/max plotting range
         xax, yax = self.analysis.GetPlotAxes()
@@ -126,6 +192,12 @@ class MainPlotArea(wx.Panel):
 
         # dictionary mapping plot objects to data for scatter plots
         scatter2measure = {}
+        id2plot = {}
+        contour = None
+        states = self.GetPlotStates()
+        plot_states = {}
+        # plots with preliminary data
+        refine = []
 
         c_plot = 0
         legend_plotted = False
@@ -135,7 +207,15 @@ class MainPlotArea(wx.Panel):
                 #k = i + j*rows
                 if (i == cols-1 and j == 0 and lcc == 1):
                     # Contour plot in upper right corner
-                    aplot = plot_contour.contour_plot(anal)
+                    preview = self.GetPreview()
+                    aplot = plot_contour.contour_plot(
+                        anal, preview=preview,
+                        workers=self.GetContourWorkers())
+                    anal.register_plot(aplot)
+                    contour = aplot
+                    plot_states[aplot] = states
+                    if preview:
+                        refine.append((aplot, None))
                     range_joined.append(aplot)
                 elif (i == cols-1 and j == 1 and lll == 1):
                     # Legend plot below contour plot
@@ -143,8 +223,15 @@ class MainPlotArea(wx.Panel):
                     legend_plotted = True
                 elif c_plot < maxplots:
                     # Scatter Plot
-                    aplot = plot_scatter.scatter_plot(anal.measurements[c_plot])
-                    scatter2measure[aplot] = anal.measurements[c_plot]
+                    mm = anal.measurements[c_plot]
+                    preview = self.GetPreview(mm)
+                    aplot = plot_scatter.scatter_plot(mm, preview=preview)
+                    scatter2measure[aplot] = mm
+                    id2plot[mm.identifier] = aplot
+                    plot_states[aplot] = states[mm.identifier]
+                    anal.register_plot(aplot, mm)
+                    if preview:
+                        refine.append((aplot, mm))
                     range_joined.append(aplot)
                     c_plot += 1
                     # Retrieve the plot hooked to selection tool
@@ -195,43 +282,205 @@ class MainPlotArea(wx.Panel):
         self.container = container
         del self.scatter2measure
         self.scatter2measure = scatter2measure
+        self.id2plot = id2plot
+        self.contour_plot = contour
+        self.plot_states = plot_states
 
         self.plot_window.redraw()
+        self.RefinePlots(refine)
         # Update the image plot (dropdown choices, etc.)
         self.frame.ImageArea.UpdateAnalysis(anal)
 
 
+    def RefinePlots(self, plots, refiner=None):
+        """Replace preliminary plot data in the background
+
+        Parameters
+        ----------
+        plots: list of tuples
+            Each item is a tuple `(plot, mm)` of a scatter plot and
+            its measurement or `(plot, None)` for the contour plot.
+        refiner: shapeout.util.progressive.Refiner
+            Refiner to use, defaults to `self.refiner`
+
+        Notes
+        -----
+        Refinement is cancelled when the plots are updated again
+        (:func:`MainPlotArea.Plot` or
+        :func:`MainPlotArea.UpdatePlotData`).
+        """
+        if refiner is None:
+            refiner = self.refiner
+        self._unrefined.update(plots)
+        jobs = []
+        # scatter plots first, the contour plot requires all measurements
+        for plot, mm in sorted(plots, key=lambda pm: pm[1] is None):
+            if mm is None:
+                compute = functools.partial(plot_contour.compute_contour_data,
+                                            self.analysis,
+                                            workers=self.GetContourWorkers())
+                apply = functools.partial(self._refine_contour, plot)
+            else:
+                compute = functools.partial(plot_scatter.get_scatter_data, mm,
+                                            viewport=self.viewport)
+                apply = functools.partial(self._refine_scatter, plot, mm,
+                                          self.viewport)
+            jobs.append((compute, apply))
+        if jobs:
+            refiner.start(jobs)
+
+    def _refine_contour(self, plot, results):
+        self._unrefined.pop(plot, None)
+        plot_contour.set_contour_data(plot, self.analysis, results=results)
+        self.plot_window.redraw()
+
+    def _refine_scatter(self, plot, mm, viewport, data):
+        if viewport != self.viewport:
+            # outdated level of detail
+            return
+        self._unrefined.pop(plot, None)
+        plot_scatter.set_scatter_data(plot, mm, data=data)
+        plot_scatter.reset_inspector(plot)
+        self.plot_window.redraw()
+
+    def GetPlotStates(self):
+        """Return the current plot states of all measurements
+
+        Returns
+        -------
+        states: dict
+            Dictionary mapping measurement identifiers to the
+            plot state (see :func:`Analysis.get_plot_state`)
+        """
+        return dict((mm.identifier, self.analysis.get_plot_state(mm))
+                    for mm in self.analysis.measurements)
+
+    def UpdatePlotData(self):
+        """Update the data of plots whose inputs changed
+
+        Only the scatter plots of measurements whose plot state
+        (filter version and plotting configuration) changed since
+        the plots were drawn are updated. The contour plot is
+        updated if the state of any measurement changed.
+        """
+        states = self.GetPlotStates()
+        dirty = []
+        for identifier, plot in self.id2plot.items():
+            if self.plot_states.get(plot) != states[identifier]:
+                dirty.append((plot, self.scatter2measure[plot]))
+        contour = self.contour_plot
+        if contour is not None and self.plot_states.get(contour) != states:
+            dirty.append((contour, None))
+        if not dirty:
+            return
+        # Pending refinements of clean plots are restarted below.
+        self.refiner.cancel()
+        self.lod_refiner.cancel()
+        refine = [(plot, mm) for plot, mm in self._unrefined.items()
+                  if (plot, mm) not in dirty]
+        for plot, mm in dirty:
+            if mm is None:
+                self.plot_states[plot] = states
+                preview = self.GetPreview()
+                plot_contour.set_contour_data(
+                    plot, self.analysis, preview=preview,
+                    workers=self.GetContourWorkers())
+            else:
+                self.plot_states[plot] = states[mm.identifier]
+                preview = self.GetPreview(mm)
+                plot_scatter.set_scatter_data(plot, mm, preview=preview,
+                                              viewport=self.viewport)
+                plot_scatter.reset_inspector(plot)
+            if preview:
+                refine.append((plot, mm))
+            else:
+                self._unrefined.pop(plot, None)
+        self.plot_window.redraw()
+        self.RefinePlots(refine)
+
+    def UpdateViewport(self, viewport):
+        """Downsample the scatter plots within the visible range
+
+        Parameters
+        ----------
+        viewport: tuple of floats
+            Visible plotting range `(xmin, xmax, ymin, ymax)`
+        """
+        if viewport == self.viewport:
+            return
+        self.viewport = viewport
+        refine = []
+        for plot, mm in self.scatter2measure.items():
+            if plot_scatter.is_scatter_data_cached(mm, viewport=viewport):
+                # e.g. zoomed out again
+                self._refine_scatter(plot, mm, viewport,
+                                     plot_scatter.get_scatter_data(
+                                         mm, viewport=viewport))
+            else:
+                refine.append((plot, mm))
+        if refine:
+            self.RefinePlots(refine, refiner=self.lod_refiner)
+        else:
+            self.lod_refiner.cancel()
+
+
     def OnPlotRangeChanged(self, obj, name, new):
         """ Is called by traits on_trait_change for plots
             
-        Updates the data in panel top
+        Updates the data in panel top. This is called for every
+        step while panning or zooming; the plotting range is only
+        stored in the analysis configuration (without filtering)
+        when the plotting range did not change for `PLOT_RANGE_DELAY`
+        milliseconds (see `OnPlotRangeSettled`).
         """
-        ctrls = self.frame.PanelTop.page_plot.GetChildren()
-        newfilt = {}
         xax, yax = self.analysis.GetPlotAxes()
+        plot_range = {
+            xax+" min": float("{:.4e}".format(obj.low[0])),
+            xax+" max": float("{:.4e}".format(obj.high[0])),
+            yax+" min": float("{:.4e}".format(obj.low[1])),
+            yax+" max": float("{:.4e}".format(obj.high[1])),
+            }
+        self.plot_range = plot_range
+        self.visible_range = (obj.low[0], obj.high[0],
+                              obj.low[1], obj.high[1])
 
         # identify controls via their name correspondence in the cfg
+        ctrls = self.frame.PanelTop.page_plot.GetChildren()
         for c in ctrls:
             name = c.GetName()
-            if name == xax+" min":
-                ol0 = float("{:.4e}".format(obj.low[0]))
-                newfilt[name] = ol0
-                c.SetValue(unicode(ol0))
-            elif name == xax+" max":
-                oh0 = float("{:.4e}".format(obj.high[0]))
-                newfilt[name] = oh0
-                c.SetValue(unicode(oh0))
-            elif name == yax+" min":
-                ol1 = float("{:.4e}".format(obj.low[1]))
-                newfilt[name] =ol1
-                c.SetValue(unicode(ol1))
-            elif name == yax+" max":
-                oh1 = float("{:.4e}".format(obj.high[1]))
-                newfilt[name] = oh1
-                c.SetValue(unicode(oh1))
-
-        cfg = {"plotting" : newfilt}
-        self.analysis.SetParameters(cfg)
+            if name in plot_range:
+                c.SetValue(unicode(plot_range[name]))
+
+        if self._range_timer is not None:
+            self._range_timer.Stop()
+        self._range_timer = wx.CallLater(PLOT_RANGE_DELAY,
+                                         self.OnPlotRangeSettled,
+                                         self.analysis)
+
+    def OnPlotRangeSettled(self, anal):
+        """Store the plotting range and update the level of detail"""
+        self._range_timer = None
+        if anal is not self.analysis:
+            # the analysis was replaced in the meantime
+            return
+        self.analysis.set_plot_range(self.plot_range)
+        self.UpdateViewport(self.visible_range)
+
+    def StopRangeTimer(self, store=False):
+        """Stop waiting for the plotting range to settle
+
+        Must be called before the analysis is cleared or replaced.
+
+        Parameters
+        ----------
+        store: bool
+            Store a pending plotting range in the current analysis
+        """
+        if self._range_timer is not None:
+            self._range_timer.Stop()
+            self._range_timer = None
+            if store:
+                self.analysis.set_plot_range(self.plot_range)
 
 
     def OnMouseScatter(self):
@@ -292,20 +541,23 @@ class MainPlotArea(wx.Panel):
         if action:
             # Get the cell and plot it
             mm = self.scatter2measure[thisplotselect]
-            # Update the currently plotted list of events
-            plotdic = mm.config.copy()["plotting"]
-            _, _, idx = mm.get_downsampled_scatter(
-                xax=plotdic["axis x"].lower(),
-                yax=plotdic["axis y"].lower(),
-                downsample=plotdic["downsampling"]*plotdic["downsample events"],
-                xscale=plotdic["scale x"],
-                yscale=plotdic["scale y"],
-                ret_mask=True,
-                )
-            # these are all events that were plotted (len(idx) == len(mm))
-            plotfilterid = np.where(idx)[0]
-            # this is the plot selection
-            sel = plotfilterid[thissel]
+            my_plot = thisplotselect.plots["scatter_events"][0]
+            click = my_plot.index.metadata.get("click")
+            sel = None
+            if click is not None:
+                # closest event among all filtered events (not only
+                # the plotted ones) within the visible range
+                low = thisplotselect.range2d.low
+                high = thisplotselect.range2d.high
+                viewport = (low[0], high[0], low[1], high[1])
+                sel = plot_scatter.get_nearest_event(mm, click[0], click[1],
+                                                     viewport=viewport)
+            if sel is None:
+                # these are all events that are plotted (preliminary or
+                # refined data, see `plot_scatter.set_scatter_data`)
+                plotfilterid = np.where(thisplotselect.event_mask)[0]
+                # this is the plot selection
+                sel = plotfilterid[thissel]
 
             mm_id = self.analysis.measurements.index(mm)
             self.frame.ImageArea.ShowEvent(mm_id=mm_id, evt_id=sel)
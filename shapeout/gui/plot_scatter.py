@@ -4,16 +4,314 @@
 from __future__ import division, unicode_literals
 
 import time
+import warnings
 
 import chaco.api as ca
 import chaco.tools.api as cta
 from chaco.default_colormaps import color_map_name_dict
+import dclab
 from dclab import definitions as dfn
+from dclab.rtdc_dataset import RTDCBase
+from dclab.util import hashobj
 import numpy as np
 
+from .. import kde
+from ..util.cache import (DATASET_LOCK, LRUCache, get_feature_key,
+                          get_filter_fingerprint)
+from ..util.lod import ScatterIndex
 from . import plot_common
 
 
+#: cached results of :func:`get_scatter_data` (see :func:`set_cache_size`)
+SCATTER_CACHE = LRUCache(maxsize=50)
+#: cached results of :func:`get_scatter_index` (see :func:`set_cache_size`)
+INDEX_CACHE = LRUCache(maxsize=20)
+
+
+def _get_scatter_params(mm, preview=False, viewport=None):
+    """Return plotting parameters and cache key of a scatter plot"""
+    plotfilters = mm.config["plotting"]
+    xax = plotfilters["axis x"].lower()
+    yax = plotfilters["axis y"].lower()
+    params = {"xax": xax,
+              "yax": yax,
+              "scalex": plotfilters["scale x"].lower(),
+              "scaley": plotfilters["scale y"].lower(),
+              "kde_type": plotfilters["kde"].lower(),
+              "xacc": plotfilters["kde accuracy "+xax],
+              "yacc": plotfilters["kde accuracy "+yax],
+              "rtol": plotfilters["kde tolerance"],
+              "downsample": int(plotfilters["downsampling"] *
+                                plotfilters["downsample events"]),
+              }
+    if preview:
+        # cheap histogram density of a few events
+        if (params["downsample"] == 0 or
+                params["downsample"] > plot_common.PREVIEW_EVENTS):
+            params["downsample"] = plot_common.PREVIEW_EVENTS
+        if params["kde_type"] != "none":
+            params["kde_type"] = "histogram"
+
+    if viewport is not None and not preview and params["downsample"]:
+        index = get_scatter_index(mm)
+        window = _scale_viewport(viewport, params["scalex"],
+                                 params["scaley"])
+        # viewports that contain all events are handled as None
+        if not (window[0] <= index.range[0] and window[1] >= index.range[1]
+                and window[2] <= index.range[2]
+                and window[3] >= index.range[3]):
+            params["viewport"] = window
+
+    key = hashobj([get_feature_key(mm, xax),
+                   get_feature_key(mm, yax),
+                   get_filter_fingerprint(mm),
+                   params["scalex"], params["scaley"], params["kde_type"],
+                   params["xacc"], params["yacc"], params["rtol"],
+                   params["downsample"], params.get("viewport")])
+    return params, key
+
+
+def _scale_viewport(viewport, scalex, scaley):
+    """Convert a viewport from data units to the plotting scale"""
+    xr = np.array(viewport[:2], dtype=float)
+    yr = np.array(viewport[2:], dtype=float)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        xr = RTDCBase._apply_scale(xr, scalex, "x")
+        yr = RTDCBase._apply_scale(yr, scaley, "y")
+    # non-positive values on a log scale
+    xr[np.isnan(xr)] = -np.inf
+    yr[np.isnan(yr)] = -np.inf
+    return [float(xr[0]), float(xr[1]), float(yr[0]), float(yr[1])]
+
+
+def get_nearest_event(mm, x, y, viewport=None):
+    """Return the filtered event closest to a point
+
+    All filtered events are taken into account, not only the
+    (downsampled) events that are plotted.
+
+    Parameters
+    ----------
+    mm: RTDCBase
+        Measurement
+    x, y: float
+        Point in data units (e.g. a clicked position)
+    viewport: tuple of floats or None
+        Visible plotting range `(xmin, xmax, ymin, ymax)` in data
+        units; distances are measured relative to this range, i.e.
+        on the screen. Defaults to the range of the events.
+
+    Returns
+    -------
+    evt_id: int or None
+        Index of the event in `mm`; None if there is no filtered
+        event or the point is invalid (e.g. negative on a log scale)
+    """
+    index = get_scatter_index(mm)
+    scalex = mm.config["plotting"]["scale x"].lower()
+    scaley = mm.config["plotting"]["scale y"].lower()
+    px, _, py, _ = _scale_viewport((x, x, y, y), scalex, scaley)
+    xscale = index.range[1] - index.range[0]
+    yscale = index.range[3] - index.range[2]
+    if viewport is not None:
+        window = _scale_viewport(viewport, scalex, scaley)
+        if np.all(np.isfinite(window)):
+            xscale = window[1] - window[0]
+            yscale = window[3] - window[2]
+    event = index.nearest(px, py,
+                          xscale=xscale if xscale > 0 else 1,
+                          yscale=yscale if yscale > 0 else 1)
+    if event is None:
+        return None
+    return int(np.flatnonzero(mm.filter.all)[event])
+
+
+def get_scatter_index(mm):
+    """Return the spatial index of the filtered events of a measurement
+
+    The index (:class:`shapeout.util.lod.ScatterIndex`) is built on
+    the plotting scale and cached for the feature data, the filter,
+    and the plotting scales.
+    """
+    plotfilters = mm.config["plotting"]
+    xax = plotfilters["axis x"].lower()
+    yax = plotfilters["axis y"].lower()
+    scalex = plotfilters["scale x"].lower()
+    scaley = plotfilters["scale y"].lower()
+    # read the cache key and the data of the same filter
+    with DATASET_LOCK:
+        key = hashobj([get_feature_key(mm, xax),
+                       get_feature_key(mm, yax),
+                       get_filter_fingerprint(mm),
+                       scalex, scaley])
+        index = INDEX_CACHE.get(key)
+        if index is None:
+            x = mm[xax][mm.filter.all]
+            y = mm[yax][mm.filter.all]
+    if index is None:
+        index = ScatterIndex(RTDCBase._apply_scale(x, scalex, xax),
+                             RTDCBase._apply_scale(y, scaley, yax))
+        INDEX_CACHE[key] = index
+    return index
+
+
+def get_scatter_data(mm, preview=False, viewport=None):
+    """Compute downsampled scatter data and density of a measurement
+
+    The results are cached for the feature data, the filter, and all
+    plotting parameters involved. This function may be called from
+    a background thread; the data are read while holding
+    :data:`shapeout.util.cache.DATASET_LOCK`.
+
+    Parameters
+    ----------
+    mm: RTDCBase
+        Measurement
+    preview: bool
+        Compute preliminary data (at most
+        :data:`plot_common.PREVIEW_EVENTS` events and a histogram
+        density) for progressive plotting
+    viewport: tuple of floats or None
+        Visible plotting range `(xmin, xmax, ymin, ymax)` in data
+        units; if given, the events are downsampled within this
+        range only (level of detail for zoomed plots). Ignored if
+        `preview` is set or if downsampling is disabled.
+
+    Returns
+    -------
+    x, y: 1d ndarrays
+        Downsampled scatter data
+    density: 1d ndarray
+        Kernel density estimate at `(x, y)`
+    mask: 1d boolean ndarray
+        Array of length `len(mm)` identifying the downsampled events
+    """
+    # The cache key and the data must belong to the same filter.
+    with DATASET_LOCK:
+        params, key = _get_scatter_params(mm, preview=preview,
+                                          viewport=viewport)
+        if key in SCATTER_CACHE:
+            return SCATTER_CACHE[key]
+
+        xax = params["xax"]
+        yax = params["yax"]
+        scalex = params["scalex"]
+        scaley = params["scaley"]
+        kde_type = params["kde_type"]
+
+        timing = {}
+        t0 = time.time()
+        lx = np.sum(mm.filter.all)
+        if "viewport" in params:
+            index = get_scatter_index(mm)
+            events = index.downsample(*params["viewport"],
+                                      samples=params["downsample"])
+            mask = np.zeros(len(mm), dtype=bool)
+            mask[np.where(mm.filter.all)[0][events]] = True
+            x = mm[xax][mask]
+            y = mm[yax][mask]
+        else:
+            x, y, mask = mm.get_downsampled_scatter(
+                xax=xax,
+                yax=yax,
+                downsample=params["downsample"],
+                xscale=scalex,
+                yscale=scaley,
+                remove_invalid=True,
+                ret_mask=True,
+                )
+        timing["downsample"] = time.time() - t0
+        if kde_type == "histogram" and not preview:
+            # the binning is shared with the contour plot
+            binning = kde.get_histogram_binning(mm,
+                                                xax=xax,
+                                                yax=yax,
+                                                xacc=params["xacc"],
+                                                yacc=params["yacc"],
+                                                xscale=scalex,
+                                                yscale=scaley)
+            binning_events = mask[mm.filter.all]
+        else:
+            # filtered events for computing the density
+            filtered_ds = dclab.new_dataset({xax: mm[xax][mm.filter.all],
+                                             yax: mm[yax][mm.filter.all]})
+    if lx == x.shape[0]:
+        positions = None
+    else:
+        positions = (x, y)
+
+    t0 = time.time()
+    if kde_type == "histogram" and not preview:
+        density = binning.get_event_density(binning_events)
+    else:
+        # In preview mode, the histogram is only evaluated at the
+        # downsampled events.
+        kde_kwargs = kde.get_kde_kwargs(
+            x=x,
+            y=y,
+            xscale=scalex,
+            yscale=scaley,
+            kde_type=kde_type,
+            xacc=params["xacc"],
+            yacc=params["yacc"],
+            rtol=params["rtol"])
+
+        density = filtered_ds.get_kde_scatter(xax=xax,
+                                              yax=yax,
+                                              positions=positions,
+                                              kde_type=kde_type,
+                                              kde_kwargs=kde_kwargs,
+                                              xscale=scalex,
+                                              yscale=scaley,
+                                              )
+    timing["density"] = time.time() - t0
+    kde.log_timing("KDE scatter {}".format(kde_type), mm.identifier,
+                   x.shape[0], timing)
+
+    SCATTER_CACHE[key] = (x, y, density, mask)
+    return x, y, density, mask
+
+
+def set_cache_size(measurements):
+    """Adapt the size of the scatter plot caches to an analysis
+
+    The cached data are computed per measurement and all measurements
+    of an analysis are visited when the plots are updated. If a cache
+    is smaller than the number of measurements, every entry is
+    evicted before it is used again.
+
+    Parameters
+    ----------
+    measurements: int
+        Number of measurements in the analysis
+    """
+    # preliminary, full, and zoomed data of each measurement
+    SCATTER_CACHE.resize(max(50, 3 * measurements))
+    # one spatial index per measurement (zooming and panning)
+    INDEX_CACHE.resize(max(20, measurements))
+
+
+def is_scatter_data_cached(mm, viewport=None):
+    """Return True if :func:`get_scatter_data` will not compute anything"""
+    _, key = _get_scatter_params(mm, viewport=viewport)
+    return key in SCATTER_CACHE
+
+
+class EventInspector(cta.ScatterInspector):
+    """Scatter inspector that records the position of the last click
+
+    The position (in data units) is stored in the "click" metadata
+    of the index data source before the plotted point is selected,
+    such that the selection can be resolved to the closest event
+    among all events (see :func:`get_nearest_event`).
+    """
+    def normal_left_down(self, event):
+        pos = self.component.map_data((event.x, event.y))
+        self.component.index.metadata["click"] = tuple(pos)
+        super(EventInspector, self).normal_left_down(event)
+
+
 def reset_inspector(plot):
     """ Hides the scatter inspector until the user clicks again.
     """
@@ -22,7 +320,7 @@ def reset_inspector(plot):
 
 
 def scatter_plot(measurement, axScatter=None, square=True, panzoom=True,
-                 select=True, ret_mask=False):
+                 select=True, ret_mask=False, preview=False):
     """Plot scatter plot for two axes of an RT-DC measurement
     
     Parameters
@@ -41,6 +339,8 @@ def scatter_plot(measurement, axScatter=None, square=True, panzoom=True,
         If set to `True`, also return a boolean array of length
         `len(measurement)` where `True` values identify the filtered
         data. 
+    preview: bool
+        Only plot preliminary data (see :func:`get_scatter_data`)
     """
     mm = measurement
     xax = mm.config["plotting"]["axis x"].lower()
@@ -82,7 +382,7 @@ def scatter_plot(measurement, axScatter=None, square=True, panzoom=True,
     sc_plot.overlays.append(elabel)
 
     # Set content of scatter plot
-    mask = set_scatter_data(sc_plot, mm)
+    mask = set_scatter_data(sc_plot, mm, preview=preview)
 
     plot_kwargs = {"name": "scatter_events",
                    "marker": "square",
@@ -168,7 +468,7 @@ def scatter_plot(measurement, axScatter=None, square=True, panzoom=True,
     if select:
         my_plot = sc_plot.plots["scatter_events"][0]
         my_plot.tools.append(
-            cta.ScatterInspector(
+            EventInspector(
                 my_plot,
                 selection_mode="single",
                 persistent_hover=False
@@ -195,57 +495,33 @@ def scatter_plot(measurement, axScatter=None, square=True, panzoom=True,
         return sc_plot
 
 
-def set_scatter_data(plot, mm):
+def set_scatter_data(plot, mm, data=None, preview=False, viewport=None):
+    """Set the scatter data of a measurement
+
+    Parameters
+    ----------
+    plot: chaco.api.Plot
+        Scatter plot
+    mm: RTDCBase
+        Measurement
+    data: tuple or None
+        Return value of :func:`get_scatter_data`; if set to None,
+        :func:`get_scatter_data` is called.
+    preview, viewport:
+        Passed to :func:`get_scatter_data` if `data` is None
+    """
     plotfilters = mm.config.copy()["plotting"]
     xax = mm.config["plotting"]["axis x"].lower()
     yax = mm.config["plotting"]["axis y"].lower()
 
-    scalex = mm.config["plotting"]["scale x"].lower()
-    scaley = mm.config["plotting"]["scale y"].lower()
-
-    x0 = mm[xax][mm.filter.all]
-
     downsample = plotfilters["downsampling"]*plotfilters["downsample events"]
 
-    a = time.time()
-    lx = x0.shape[0]
-    x, y, mask = mm.get_downsampled_scatter(xax=xax,
-                                            yax=yax,
-                                            downsample=downsample,
-                                            xscale=scalex,
-                                            yscale=scaley,
-                                            remove_invalid=True,
-                                            ret_mask=True,
-                                            )
-    if lx == x.shape:
-        positions = None
-    else:
-        print("...Downsampled from {} to {} in {:.2f}s".format(lx, x.shape[0], time.time()-a))
-        positions = (x, y)
-
-
-    kde_type = mm.config["plotting"]["kde"].lower()
+    if data is None:
+        data = get_scatter_data(mm, preview=preview, viewport=viewport)
+    x, y, density, mask = data
+    # events currently shown (used for selecting events)
+    plot.event_mask = mask
 
-    kde_kwargs = plot_common.get_kde_kwargs(
-        x=x,
-        y=y,
-        xscale=scalex,
-        yscale=scaley,
-        kde_type=kde_type,
-        xacc=mm.config["plotting"]["kde accuracy "+xax],
-        yacc=mm.config["plotting"]["kde accuracy "+yax])
-    
-    a = time.time()
-    density = mm.get_kde_scatter(xax=xax,
-                                 yax=yax,
-                                 positions=positions,
-                                 kde_type=kde_type,
-                                 kde_kwargs=kde_kwargs,
-                                 xscale=scalex,
-                                 yscale=scaley,
-                                 )
-    print("...KDE scatter time {}: {:.2f}s".format(kde_type, time.time()-a))
-    
     pd = plot.data
     pd.set_data("index", x)
     pd.set_data("value", y)
@@ -254,7 +530,8 @@ def set_scatter_data(plot, mm):
     # Plot filtered data in grey
     if (plotfilters["Scatter Plot Excluded Events"] and
         mm.filter.all.sum() != len(mm)):
-        mm.apply_filter()
+        with DATASET_LOCK:
+            mm.apply_filter()
         # determine the number of points we are allowed to add
         if downsample:
             # respect the maximum limit of plotted events
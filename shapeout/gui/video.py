@@ -8,16 +8,20 @@ import dclab
 from enable.api import Window
 import numpy as np
 from PIL import Image
-from scipy.ndimage import binary_erosion
 import wx
 from wx.lib.scrolledpanel import ScrolledPanel
 
+from ..util.cache import get_filter_fingerprint
+from ..util.event_images import EventImageCache
+
 
 class ImagePanel(ScrolledPanel):
     def __init__(self, parent, frame):
         ScrolledPanel.__init__(self, parent, -1)
         self.frame = frame
         self.parent = parent
+        # decoded event images of the measurements (by identifier)
+        self.image_caches = {}
 
         self.SetupScrolling(scroll_y=True, scroll_x=True)
 
@@ -176,25 +180,9 @@ class ImagePanel(ScrolledPanel):
             assert ds_id == -1
 
         if (ds_id != -1 and "image" in ds and len(ds["image"]) > evt_id):
-            # Get the gray scale cell image
-            cellimg = ds["image"][evt_id]
-            if np.all(np.isnan(cellimg)):
-                # No image data - return white image
-                cellimg = 255*np.ones_like(cellimg, dtype=np.uint8)
-            # Convert to RGB
-            cellimg = cellimg.reshape(cellimg.shape[0], cellimg.shape[1], 1)
-            cellimg = np.repeat(cellimg, 3, axis=2)
-            # Only load contour data if there is an image column.
-            # We don't know how big the images should be so we
-            # might run into trouble displaying random contours.
-            if (contour and "mask" in ds and len(ds["mask"]) > evt_id):
-                mask = ds["mask"][evt_id]
-                # compute contour image from mask
-                cont = mask ^ binary_erosion(mask)
-                # set red contour pixel values in original image
-                cellimg[cont, 0] = 255
-                cellimg[cont, 1] = 0
-                cellimg[cont, 2] = 0
+            # Get the RGB cell image (contour only drawn if there
+            # is an image column, see `EventImageCache`)
+            cellimg = self.GetImageCache(ds).get_rgb(evt_id, contour=contour)
         else:
             x = np.linspace(0, 255, self.startSizeX*self.startSizeY)
             cellimg = np.array(x.reshape(self.startSizeY,self.startSizeX),
@@ -204,6 +192,23 @@ class ImagePanel(ScrolledPanel):
         return image
 
 
+    def GetImageCache(self, mm):
+        """Return the event image cache of a measurement"""
+        if mm.format == "hierarchy":
+            # the events of a hierarchy child depend on the parent filter
+            state = get_filter_fingerprint(mm.hparent)
+        else:
+            state = None
+        if mm.identifier in self.image_caches:
+            cstate, cache = self.image_caches[mm.identifier]
+            if cstate == state:
+                return cache
+            cache.cancel()
+        cache = EventImageCache(mm)
+        self.image_caches[mm.identifier] = state, cache
+        return cache
+
+
     def OnChBoxExclude(self, e=None):
         """ If the exclude-check box is triggered, change the
         corresponding value in the measurement."""
@@ -272,6 +277,9 @@ class ImagePanel(ScrolledPanel):
         self.UpdateSelections(mm_id=mm_id, evt_id=evt_id)
 
         self.PlotImage()
+        if "image" in mm:
+            # decode the neighboring events while the user browses
+            self.GetImageCache(mm).prefetch(evt_id)
 
         # Update exclude check-box
         self.WXChB_exclude.SetValue(not mm.filter.manual[evt_id])
@@ -329,6 +337,11 @@ class ImagePanel(ScrolledPanel):
     def UpdateAnalysis(self, analysis):
         """ Update the choices of the dopdown list with a new analysis """
         self.analysis = analysis
+        # only keep the images of measurements in the new analysis
+        identifiers = [mm.identifier for mm in analysis.measurements]
+        for key in list(self.image_caches.keys()):
+            if key not in identifiers:
+                self.image_caches.pop(key)[1].cancel()
         self.UpdateSelections()
 
 
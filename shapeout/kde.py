@@ -0,0 +1,768 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Shape-Out - kernel density estimates and contours for plotting"""
+from __future__ import division, unicode_literals
+
+import atexit
+import logging
+import multiprocessing as mp
+from multiprocessing.pool import ThreadPool
+import threading
+import time
+import warnings
+
+import dclab
+from dclab import kde_contours, kde_methods
+from dclab.rtdc_dataset import RTDCBase
+from dclab.util import hashobj
+import numpy as np
+from scipy.interpolate import RectBivariateSpline
+from scipy.signal import fftconvolve
+from scipy.spatial import cKDTree
+
+from .util.cache import (DATASET_LOCK, LRUCache, get_feature_key,
+                         get_filter_fingerprint)
+
+
+logger = logging.getLogger(__name__)
+
+#: grid points per bandwidth for :func:`kde_fft`
+FFT_POINTS_PER_BW = 4
+#: maximum total number of grid points of :func:`kde_fft` (about
+#: 32MB per grid array); if a finer grid is required, the density is
+#: computed with :func:`kde_tree`
+FFT_MAX_POINTS = 2**22
+#: Gaussian kernels are truncated at this many bandwidths
+FFT_TRUNCATE = 4
+#: number of output positions processed at once by :func:`kde_tree`
+TREE_CHUNK_SIZE = 1000
+
+#: cached results of :func:`get_histogram_binning`
+#: (see :func:`set_cache_size`)
+BINNING_CACHE = LRUCache(maxsize=20)
+
+#: process pool for computing contours (see :func:`get_pool`)
+_POOL = None
+_POOL_SIZE = None
+_POOL_LOCK = threading.Lock()
+
+
+class HistogramBinning(object):
+    def __init__(self, x, y, xacc, yacc, xscale="linear", yscale="linear"):
+        """Bin indices of events for the "histogram" KDE
+
+        The events are assigned to the bins of a two-dimensional
+        histogram once. The histogram density, the density at the
+        events (scatter plot coloring), and the density levels of
+        quantiles (contour plots) are then computed from these
+        integer bin indices.
+
+        The density is identical to that of
+        :func:`dclab.kde_methods.kde_histogram` with the bins given
+        by :func:`get_kde_kwargs`. Note that the density at the
+        events is the spline interpolation of the histogram (as in
+        dclab) and not the histogram value of their bins. The
+        contour lines are computed from the interpolated density on
+        a grid and the quantile levels must refer to the same
+        density; otherwise the contours do not enclose the requested
+        fraction of events.
+
+        Parameters
+        ----------
+        x, y: 1d ndarrays
+            Event data (not scaled)
+        xacc, yacc: float
+            KDE accuracies (on the plotting scale)
+        xscale, yscale: str
+            Plotting scales ("linear" or "log")
+        """
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            xs = RTDCBase._apply_scale(x, xscale, "x")
+            ys = RTDCBase._apply_scale(y, yscale, "y")
+        self.xscale = xscale
+        self.yscale = yscale
+        #: events that are not nan or inf on the plotting scale
+        self.valid = ~kde_methods.get_bad_vals(xs, ys)
+        self.bins = [get_histogram_bins(xs, xacc),
+                     get_histogram_bins(ys, yacc)]
+        # scaled event data (only kept until the density at the
+        # events is computed)
+        self._xs = xs
+        self._ys = ys
+        self.xedges, ix = self._get_bin_index(xs[self.valid], self.bins[0])
+        self.yedges, iy = self._get_bin_index(ys[self.valid], self.bins[1])
+        #: flat histogram bin index of each valid event
+        self.index = ix * self.bins[1] + iy
+
+        # same normalization as `np.histogram2d(..., normed=True)`
+        counts = np.bincount(self.index, minlength=self.bins[0]*self.bins[1])
+        hist = counts.reshape(self.bins).astype(float)
+        hist = hist / np.diff(self.xedges).reshape(-1, 1)
+        hist = hist / np.diff(self.yedges).reshape(1, -1)
+        if counts.sum():
+            hist /= counts.sum()
+        #: histogram density
+        self.histogram = hist
+
+        self._spline = None
+        # density at the events (computed on demand)
+        self._event_density = None
+        # the binning is shared by threads (scatter and contour plots)
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _get_bin_index(a, bins):
+        """Return histogram bin edges and bin indices of `a`
+
+        The bins are identical to those of :func:`numpy.histogram2d`.
+        """
+        if a.size:
+            amin, amax = a.min(), a.max()
+        else:
+            amin, amax = 0, 1
+        if amin == amax:
+            amin -= .5
+            amax += .5
+        edges = np.linspace(amin, amax, bins + 1)
+        idx = np.searchsorted(edges, a, side="right")
+        # values on the right edge belong to the last bin
+        idx[a == edges[-1]] -= 1
+        return edges, idx - 1
+
+    @property
+    def spline(self):
+        """Spline interpolation of the histogram density"""
+        with self._lock:
+            if self._spline is None:
+                xip = self.xedges[1:]-(self.xedges[1]-self.xedges[0])/2
+                yip = self.yedges[1:]-(self.yedges[1]-self.yedges[0])/2
+                self._spline = RectBivariateSpline(x=xip, y=yip,
+                                                   z=self.histogram)
+        return self._spline
+
+    def density(self, xout, yout):
+        """Evaluate the density on the plotting scale
+
+        Parameters
+        ----------
+        xout, yout: ndarrays
+            Coordinates on the plotting scale (e.g. a contour grid)
+        """
+        density = np.zeros(xout.shape) * np.nan
+        bad = kde_methods.get_bad_vals(xout, yout)
+        if np.any(self.valid):
+            dv = self.spline.ev(xout[~bad], yout[~bad])
+            dv[dv < 0] = 0
+            density[~bad] = dv
+        return density
+
+    def get_event_density(self, events=None):
+        """Density at the events
+
+        The density at all events is computed once with the first
+        call; it is shared by scatter plot coloring (see
+        :func:`shapeout.gui.plot_scatter.get_scatter_data`) and
+        :func:`HistogramBinning.get_quantile_levels`.
+
+        Parameters
+        ----------
+        events: 1d ndarray or None
+            Boolean or integer index array of the events; set to
+            None to get the density at all events.
+
+        Returns
+        -------
+        density: 1d ndarray
+            Density at the events (nan for invalid events)
+        """
+        with self._lock:
+            if self._event_density is None:
+                density = np.zeros(self.valid.size) * np.nan
+                if np.any(self.valid):
+                    dv = self.spline.ev(self._xs[self.valid],
+                                        self._ys[self.valid])
+                    dv[dv < 0] = 0
+                    density[self.valid] = dv
+                self._event_density = density
+                # the scaled event data are not needed anymore
+                self._xs = self._ys = None
+        if events is None:
+            return self._event_density
+        else:
+            return self._event_density[events]
+
+    def get_quantile_levels(self, q, norm=1):
+        """Density levels for the quantiles `q` of the events
+
+        Parameters
+        ----------
+        q: array_like or float between 0 and 1
+            Quantiles (see
+            :func:`dclab.kde_contours.get_quantile_levels`)
+        norm: float
+            Value by which the density is normalized, usually
+            the maximum of the density on the contour grid
+        """
+        dp = self.get_event_density(self.valid) / norm
+        if not np.isscalar(q):
+            q = np.array(q)
+        return np.nanpercentile(dp, q=q*100)
+
+
+def compute_contours(x, y, xax, yax, xscale, yscale, kde_type,
+                     kde_acc, contour_acc, levels, mode="quantile",
+                     kde_rtol=1e-3, binning=None):
+    """Compute the contour lines of a two-dimensional dataset
+
+    This function only works with arrays (no RT-DC datasets)
+    and can thus be used in a process pool.
+
+    Parameters
+    ----------
+    x, y: 1d ndarrays
+        Filtered event data
+    xax, yax: str
+        Names of the features `x` and `y`
+    xscale, yscale: str
+        Plotting scales ("linear" or "log")
+    kde_type: str
+        KDE method (see :data:`dclab.kde_methods.methods`)
+    kde_acc: tuple of floats
+        KDE accuracies in x and y
+    contour_acc: tuple of floats
+        Contour accuracies in x and y
+    levels: list of floats
+        Contour levels
+    mode: str
+        Contour level mode ("fraction" or "quantile")
+    kde_rtol: float
+        Relative error tolerance of the "tree" KDE
+    binning: HistogramBinning or None
+        Binning of `x` and `y` for the "histogram" KDE (computed
+        if not given)
+
+    Returns
+    -------
+    contours: list
+        For each level, a list of 2d arrays of shape (N, 2)
+        representing the contour lines
+    timing: dict
+        Computation times [s] of the "kde", the "levels",
+        and the "contours"
+    """
+    timing = {}
+    t0 = time.time()
+    if kde_type == "histogram":
+        if binning is None:
+            binning = HistogramBinning(x=x, y=y,
+                                       xacc=kde_acc[0], yacc=kde_acc[1],
+                                       xscale=xscale, yscale=yscale)
+        X, Y, density = get_binning_contour(binning, contour_acc)
+    else:
+        kde_kwargs = get_kde_kwargs(x=x,
+                                    y=y,
+                                    xscale=xscale,
+                                    yscale=yscale,
+                                    kde_type=kde_type,
+                                    xacc=kde_acc[0],
+                                    yacc=kde_acc[1],
+                                    rtol=kde_rtol)
+        ds = dclab.new_dataset({xax: x, yax: y})
+        X, Y, density = ds.get_kde_contour(xax=xax,
+                                           yax=yax,
+                                           xacc=contour_acc[0],
+                                           yacc=contour_acc[1],
+                                           xscale=xscale,
+                                           yscale=yscale,
+                                           kde_type=kde_type,
+                                           kde_kwargs=kde_kwargs,
+                                           )
+    if X.shape[0] == 1 or X.shape[1] == 1:
+        raise ValueError("Please decrease value for contour accuracy!")
+    t1 = time.time()
+    timing["kde"] = t1 - t0
+
+    levels = np.array(levels)
+    if mode == "fraction":
+        plev = levels
+    elif mode == "quantile" and kde_type == "histogram":
+        plev = binning.get_quantile_levels(q=levels, norm=density.max())
+    elif mode == "quantile":
+        plev = kde_contours.get_quantile_levels(density,
+                                                x=X,
+                                                y=Y,
+                                                xp=x,
+                                                yp=y,
+                                                q=levels,
+                                                normalize=True)
+    else:
+        raise ValueError("Unknown contour level mode `{}`!".format(mode))
+    t2 = time.time()
+    timing["levels"] = t2 - t1
+
+    contours = []
+    for level in plev:
+        cc = kde_contours.find_contours_level(density, x=X, y=Y, level=level)
+        contours.append(cc)
+    timing["contours"] = time.time() - t2
+    return contours, timing
+
+
+def get_binning_contour(binning, contour_acc):
+    """Histogram density on a contour grid
+
+    This is the equivalent of :func:`dclab.rtdc_dataset.RTDCBase.
+    get_kde_contour` for the "histogram" KDE of a
+    :class:`HistogramBinning`.
+
+    Parameters
+    ----------
+    binning: HistogramBinning
+        Binning of the events
+    contour_acc: tuple of floats
+        Contour accuracies in x and y (on the plotting scale)
+
+    Returns
+    -------
+    X, Y, density: 2d ndarrays
+        Contour grid (not scaled) and density
+    """
+    xc = binning.xedges
+    yc = binning.yedges
+    xnum = int(np.ceil((xc[-1] - xc[0]) / contour_acc[0]))
+    ynum = int(np.ceil((yc[-1] - yc[0]) / contour_acc[1]))
+    xlin = np.linspace(xc[0], xc[-1], xnum, endpoint=True)
+    ylin = np.linspace(yc[0], yc[-1], ynum, endpoint=True)
+    xmesh, ymesh = np.meshgrid(xlin, ylin, indexing="ij")
+    density = binning.density(xmesh, ymesh)
+    # Convert mesh back to linear scale if applicable
+    if binning.xscale == "log":
+        xmesh = np.exp(xmesh)
+    if binning.yscale == "log":
+        ymesh = np.exp(ymesh)
+    return xmesh, ymesh, density
+
+
+def _compute_contours_kw(kwargs):
+    return compute_contours(**kwargs)
+
+
+def compute_contours_parallel(kwargs_list, workers=1):
+    """Call :func:`compute_contours` for several datasets
+
+    Jobs with a `binning` (see :func:`get_histogram_binning`) are
+    computed in `workers` threads of the current process, such that
+    the density at the events is computed with the binning that is
+    shared with the scatter plot (and the binning is not sent to a
+    worker process). Only the event data `x` and `y` of the other
+    jobs are sent to `workers` worker processes.
+
+    Parameters
+    ----------
+    kwargs_list: list of dicts
+        Keyword arguments for :func:`compute_contours`
+    workers: int
+        Number of worker processes (and threads); set to 1 to compute
+        everything sequentially in the current process and to 0 to
+        use as many workers as there are CPUs.
+
+    Returns
+    -------
+    results: list
+        Return values of :func:`compute_contours` in the order
+        of `kwargs_list`
+    """
+    if workers == 0:
+        workers = mp.cpu_count()
+    remote = [ii for ii, kw in enumerate(kwargs_list)
+              if kw.get("binning") is None]
+    if min(workers, len(remote)) > 1:
+        pending = get_pool(min(workers, len(remote))).map_async(
+            _compute_contours_kw, [kwargs_list[ii] for ii in remote])
+    else:
+        remote = []
+    local = [ii for ii in range(len(kwargs_list)) if ii not in remote]
+    threads = min(workers, len(local))
+    if threads > 1:
+        pool = ThreadPool(processes=threads)
+        try:
+            computed = pool.map(_compute_contours_kw,
+                                [kwargs_list[ii] for ii in local])
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        computed = [compute_contours(**kwargs_list[ii]) for ii in local]
+    results = [None] * len(kwargs_list)
+    for ii, res in zip(local, computed):
+        results[ii] = res
+    if remote:
+        for ii, res in zip(remote, pending.get()):
+            results[ii] = res
+    return results
+
+
+def _fft_grid(a, bw, points_per_bw=FFT_POINTS_PER_BW):
+    """Return offset, spacing, and size of a 1d grid for `kde_fft`"""
+    lo = a.min() - FFT_TRUNCATE * bw
+    hi = a.max() + FFT_TRUNCATE * bw
+    num = int(np.ceil((hi - lo) / bw * points_per_bw)) + 1
+    num = max(num, 2)
+    return lo, (hi - lo) / (num - 1), num
+
+
+def _fft_density(events_x, events_y, xout, yout, bw, gridx, gridy):
+    """Binned Gaussian KDE on the grids `gridx` and `gridy`
+
+    See :func:`kde_fft`; the input must be free of nan and inf values.
+    """
+    nx, ny = gridx[2], gridy[2]
+
+    # linear binning
+    ix, wx = _grid_weights(events_x, gridx)
+    iy, wy = _grid_weights(events_y, gridy)
+    idx = ix * ny + iy
+    counts = np.zeros(nx * ny)
+    for off, ww in [(0, (1 - wx) * (1 - wy)),
+                    (ny, wx * (1 - wy)),
+                    (1, (1 - wx) * wy),
+                    (ny + 1, wx * wy)]:
+        counts += np.bincount(idx + off, weights=ww, minlength=nx * ny)
+    counts = counts.reshape(nx, ny)
+
+    # convolution with Gaussian kernel
+    kernel = np.outer(_gauss_kernel(gridx, bw[0]),
+                      _gauss_kernel(gridy, bw[1]))
+    grid_density = fftconvolve(counts, kernel, mode="same") / events_x.size
+    # remove negative round-off errors of the FFT
+    grid_density[grid_density < 0] = 0
+
+    # bilinear interpolation
+    xo = xout.flatten()
+    yo = yout.flatten()
+    ox, owx = _grid_weights(xo, gridx)
+    oy, owy = _grid_weights(yo, gridy)
+    density = (grid_density[ox, oy] * (1 - owx) * (1 - owy)
+               + grid_density[ox + 1, oy] * owx * (1 - owy)
+               + grid_density[ox, oy + 1] * (1 - owx) * owy
+               + grid_density[ox + 1, oy + 1] * owx * owy)
+    return density.reshape(xout.shape)
+
+
+def _grid_weights(a, grid):
+    """Return lower grid indices and linear weights of `a` on `grid`"""
+    lo, delta, num = grid
+    fa = (a - lo) / delta
+    idx = np.clip(np.floor(fa).astype(int), 0, num - 2)
+    weights = np.clip(fa - idx, 0, 1)
+    return idx, weights
+
+
+def _gauss_kernel(grid, bw):
+    """Gaussian kernel sampled on the spacing of `grid`"""
+    _, delta, num = grid
+    size = min(int(np.ceil(FFT_TRUNCATE * bw / delta)), num - 1)
+    dist = np.arange(-size, size + 1) * delta
+    return np.exp(-.5 * (dist / bw)**2) / (np.sqrt(2 * np.pi) * bw)
+
+
+@kde_methods.ignore_nan_inf
+def kde_fft(events_x, events_y, xout=None, yout=None, bw=None):
+    """ Binned Gaussian Kernel Density Estimation
+
+    The events are distributed to a regular grid (linear binning)
+    which is then convolved with a Gaussian kernel using the fast
+    Fourier transform. The density at the output coordinates is
+    obtained by bilinear interpolation. The result approximates
+    :func:`dclab.kde_methods.kde_multivariate` with a computational
+    cost that is linear in the number of events.
+
+    If the grid required for the bandwidth has more than
+    :data:`FFT_MAX_POINTS` points (data range much larger than the
+    bandwidth), the density is computed with :func:`kde_tree`
+    instead and a warning is issued.
+
+    Parameters
+    ----------
+    events_x, events_y: 1D ndarray
+        The input points for kernel density estimation. Input
+        is flattened automatically.
+    xout, yout: ndarray
+        The coordinates at which the KDE should be computed.
+        If set to none, input coordinates are used.
+    bw: tuple (bwx, bwy) or None
+        The bandwith (standard deviation of the Gaussian kernel)
+        for kernel density estimation.
+
+    Returns
+    -------
+    density: ndarray, same shape as `xout`
+        The KDE for the points in (xout, yout)
+    """
+    valid_combi = ((xout is None and yout is None) or
+                   (xout is not None and yout is not None)
+                   )
+    if not valid_combi:
+        raise ValueError("Both `xout` and `yout` must be (un)set.")
+
+    if yout is None and yout is None:
+        xout = events_x
+        yout = events_y
+
+    events_x = events_x.flatten()
+    events_y = events_y.flatten()
+    if events_x.size == 0:
+        return np.zeros(xout.shape)
+
+    if bw is None:
+        # divide by 2 to make it comparable to histogram KDE
+        bw = (kde_methods.bin_width_doane(events_x) / 2,
+              kde_methods.bin_width_doane(events_y) / 2)
+
+    gridx = _fft_grid(events_x, bw[0])
+    gridy = _fft_grid(events_y, bw[1])
+    if gridx[2] * gridy[2] > FFT_MAX_POINTS:
+        warnings.warn("The data range is too large for the bandwidth of "
+                      "the 'fft' KDE ({}x{} grid points); using the "
+                      "'tree' KDE instead.".format(gridx[2], gridy[2]))
+        return kde_tree(events_x, events_y, xout=xout, yout=yout, bw=bw)
+    return _fft_density(events_x, events_y, xout, yout, bw, gridx, gridy)
+
+
+@kde_methods.ignore_nan_inf
+def kde_tree(events_x, events_y, xout=None, yout=None, bw=None, rtol=1e-3):
+    """ Tree-based approximate Multivariate Kernel Density Estimation
+
+    Only events close to an output position are taken into account;
+    these are found with a k-d tree. The truncation radius of each
+    output position is chosen (starting from an estimate with
+    :func:`kde_fft`) such that the (worst-case) error of the density
+    is below `rtol` times the density. For densities smaller than
+    `rtol` times the maximum density, the error is below `rtol**2`
+    times the maximum density.
+
+    Parameters
+    ----------
+    events_x, events_y: 1D ndarray
+        The input points for kernel density estimation. Input
+        is flattened automatically.
+    xout, yout: ndarray
+        The coordinates at which the KDE should be computed.
+        If set to none, input coordinates are used.
+    bw: tuple (bwx, bwy) or None
+        The bandwith (standard deviation of the Gaussian kernel)
+        for kernel density estimation.
+    rtol: float
+        Relative error tolerance (between 0 and 1)
+
+    Returns
+    -------
+    density: ndarray, same shape as `xout`
+        The KDE for the points in (xout, yout)
+
+    See Also
+    --------
+    `dclab.kde_methods.kde_multivariate`: exact version
+    """
+    valid_combi = ((xout is None and yout is None) or
+                   (xout is not None and yout is not None)
+                   )
+    if not valid_combi:
+        raise ValueError("Both `xout` and `yout` must be (un)set.")
+    if not 0 < rtol < 1:
+        raise ValueError("`rtol` must be between 0 and 1, got {}!".format(
+            rtol))
+
+    if yout is None and yout is None:
+        xout = events_x
+        yout = events_y
+
+    if events_x.size == 0:
+        return np.zeros(xout.shape)
+
+    if bw is None:
+        # divide by 2 to make it comparable to histogram KDE
+        bw = (kde_methods.bin_width_doane(events_x) / 2,
+              kde_methods.bin_width_doane(events_y) / 2)
+
+    # scale the data such that the kernel is a unit Gaussian
+    events = np.column_stack((events_x.flatten() / bw[0],
+                              events_y.flatten() / bw[1]))
+    positions = np.column_stack((xout.flatten() / bw[0],
+                                 yout.flatten() / bw[1]))
+    tree = cKDTree(events)
+    size = events.shape[0]
+    # Estimate the kernel sums with the binned KDE to find the radius
+    # that is required for each position (see `error` below).
+    ex = events_x.flatten()
+    ey = events_y.flatten()
+    gridx = _fft_grid(ex, bw[0])
+    gridy = _fft_grid(ey, bw[1])
+    coarsening = np.sqrt(gridx[2] * gridy[2] / FFT_MAX_POINTS)
+    if coarsening > 1:
+        # A coarse estimate only increases the number of iterations.
+        gridx = _fft_grid(ex, bw[0], FFT_POINTS_PER_BW / coarsening)
+        gridy = _fft_grid(ey, bw[1], FFT_POINTS_PER_BW / coarsening)
+    estimate = _fft_density(ex, ey, xout, yout, bw, gridx, gridy)
+    estimate = estimate.flatten() * (2 * np.pi * bw[0] * bw[1] * size) / 2
+    estimate = np.maximum(estimate, rtol * estimate.max())
+    radius = np.sqrt(2 * np.log(np.maximum(size / (rtol * estimate), 1)))
+    # use a few discrete radii to limit the number of tree queries
+    radius = np.ceil(np.maximum(radius, 1) * 4) / 4
+    # unnormalized kernel sums
+    near = np.zeros(positions.shape[0])
+    todo = np.arange(positions.shape[0])
+    while todo.size:
+        count = np.zeros(positions.shape[0], dtype=int)
+        for rad in np.unique(radius[todo]):
+            rtodo = todo[radius[todo] == rad]
+            for start in range(0, rtodo.size, TREE_CHUNK_SIZE):
+                chunk = rtodo[start:start + TREE_CHUNK_SIZE]
+                pairs = cKDTree(positions[chunk]).sparse_distance_matrix(
+                    tree, rad, output_type="ndarray")
+                near[chunk] = np.bincount(
+                    pairs["i"],
+                    weights=np.exp(-.5 * pairs["v"]**2),
+                    minlength=chunk.size)
+                count[chunk] = np.bincount(pairs["i"], minlength=chunk.size)
+        # Every event outside of `radius` contributes less than this:
+        error = (size - count[todo]) * np.exp(-.5 * radius[todo]**2)
+        allowed = rtol * np.maximum(near[todo], rtol * near.max())
+        todo = todo[error > allowed]
+        radius[todo] *= 1.5
+
+    density = near / (2 * np.pi * bw[0] * bw[1] * size)
+    return density.reshape(xout.shape)
+
+
+# Make the additional KDE methods available in dclab
+kde_methods.methods["fft"] = kde_fft
+kde_methods.methods["tree"] = kde_tree
+
+
+def set_cache_size(measurements):
+    """Adapt the size of :data:`BINNING_CACHE` to an analysis
+
+    The binnings are cached per measurement and all measurements
+    of an analysis are visited when the plots are updated. If the
+    cache is smaller than the number of measurements, every entry
+    is evicted before it is used again.
+
+    Parameters
+    ----------
+    measurements: int
+        Number of measurements in the analysis
+    """
+    # current and previous plotting parameters of each measurement
+    BINNING_CACHE.resize(max(20, 2 * measurements))
+
+
+def get_kde_kwargs(x, y, kde_type, xacc, yacc, xscale, yscale,
+                   rtol=1e-3):
+    """Copmutes optimal default KDE kwargs"""
+    kde_kwargs = {}
+    if kde_type in ["fft", "multivariate"]:
+        kde_kwargs["bw"] = [xacc, yacc]
+    elif kde_type == "tree":
+        kde_kwargs["bw"] = [xacc, yacc]
+        kde_kwargs["rtol"] = rtol
+    elif kde_type == "histogram":
+        # scale the x and y axes (fixes #264)
+        x = dclab.rtdc_dataset.RTDCBase._apply_scale(x, xscale, "x")
+        y = dclab.rtdc_dataset.RTDCBase._apply_scale(y, yscale, "y")
+        kde_kwargs["bins"] = [get_histogram_bins(x, xacc),
+                              get_histogram_bins(y, yacc)]
+    return kde_kwargs
+
+
+def get_histogram_bins(a, acc):
+    """Number of bins of the "histogram" KDE
+
+    Parameters
+    ----------
+    a: 1d ndarray
+        Event data on the plotting scale
+    acc: float
+        KDE accuracy
+    """
+    # The histogram accuracy is scaled by 1.8 to approximately
+    # match the multivariate kde.
+    try:
+        num = naninfminmaxdiff(a)/(1.8*acc)
+    except:
+        num = 5
+    return int(max(5, num))
+
+
+def get_histogram_binning(mm, xax, yax, xacc, yacc, xscale="linear",
+                          yscale="linear"):
+    """Return the :class:`HistogramBinning` of the filtered events
+
+    The binning is cached for the feature data, the filter,
+    the accuracies, and the plotting scales of the measurement `mm`.
+    This function may be called from a background thread.
+    """
+    # read the cache key and the data of the same filter
+    with DATASET_LOCK:
+        key = hashobj([get_feature_key(mm, xax),
+                       get_feature_key(mm, yax),
+                       get_filter_fingerprint(mm),
+                       xacc, yacc, xscale, yscale])
+        binning = BINNING_CACHE.get(key)
+        if binning is None:
+            x = mm[xax][mm.filter.all]
+            y = mm[yax][mm.filter.all]
+    if binning is None:
+        binning = HistogramBinning(x=x, y=y, xacc=xacc, yacc=yacc,
+                                   xscale=xscale, yscale=yscale)
+        BINNING_CACHE[key] = binning
+    return binning
+
+
+def close_pool():
+    """Terminate the process pool of :func:`get_pool` (if any)
+
+    This function is called when the interpreter exits.
+    """
+    global _POOL, _POOL_SIZE
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.terminate()
+            _POOL.join()
+        _POOL = None
+        _POOL_SIZE = None
+
+
+atexit.register(close_pool)
+
+
+def get_pool(processes):
+    """Return a process pool with `processes` worker processes
+
+    The pool is kept alive and reused as long as the number of
+    processes does not change (see :func:`close_pool`).
+    """
+    global _POOL, _POOL_SIZE
+    with _POOL_LOCK:
+        if _POOL is None or _POOL_SIZE != processes:
+            if _POOL is not None:
+                _POOL.terminate()
+                _POOL.join()
+            _POOL = mp.Pool(processes)
+            _POOL_SIZE = processes
+        return _POOL
+
+
+def log_timing(name, identifier, events, timing):
+    """Log a timing dictionary returned by e.g. :func:`compute_contours`"""
+    logger.info("%s: identifier=%s events=%d %s", name, identifier, events,
+                " ".join(["{}={:.3f}s".format(k, timing[k])
+                          for k in sorted(timing.keys())]))
+
+
+def naninfminmaxdiff(x):
+    bad = np.isnan(x) | np.isinf(x)
+    x = x[~bad]
+    diff = (x.max()-x.min())
+    return diff
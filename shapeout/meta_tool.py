@@ -4,9 +4,12 @@
 from __future__ import division, unicode_literals
 
 import hashlib
+from multiprocessing.pool import ThreadPool
 import pathlib
+import time
 import warnings
 
+import appdirs
 import h5py
 import imageio
 import nptdms
@@ -15,34 +18,92 @@ from dclab.rtdc_dataset import config as rt_config
 from dclab.rtdc_dataset import fmt_tdms
 
 from .util import path_to_str
+from .util.file_index import FileIndex, get_stat
 
 from . import settings
 
 
-def collect_data_tree(directories):
+#: attributes of .rtdc files required by Shape-Out
+RTDC_KEYS = ["experiment:event count",
+             "experiment:sample",
+             "experiment:run index",
+             "imaging:pixel size",
+             "setup:channel width",
+             "setup:chip region",
+             "setup:flow rate",
+             ]
+
+#: number of threads for scanning directories and reading metadata
+SCAN_WORKERS = 8
+
+#: index of extracted metadata (see :func:`get_metadata_index`)
+_METADATA_INDEX = []
+
+#: index of event counts (see :func:`get_event_count_index`)
+_EVENT_COUNT_INDEX = []
+
+
+def collect_data_tree(directories, workers=SCAN_WORKERS):
     """Return projects (folders) and measurements therein
 
     This is a convenience function for the GUI
+
+    See Also
+    --------
+    iter_data_tree: progressively yield the projects and measurements
+    """
+    for data in iter_data_tree(directories, workers=workers, interval=None):
+        pass
+    return data
+
+
+def iter_data_tree(directories, workers=SCAN_WORKERS, interval=.5):
+    """Progressively yield projects (folders) and measurements therein
+
+    The directories are scanned and the metadata of the measurements
+    are read with a pool of `workers` threads. The measurements are
+    added in a deterministic order (see :func:`find_data`), independent
+    of the order in which the threads finish.
+
+    Parameters
+    ----------
+    directories: str or pathlib.Path or list of those
+        Directories to search for measurements
+    workers: int
+        Maximum number of threads
+    interval: float or None
+        Minimum time [s] between two yielded results; if set to
+        None, only the complete result is yielded.
+
+    Yields
+    ------
+    treelist: list
+        All projects and measurements found so far
+    cols: list
+        Column names of the tree
     """
     if not isinstance(directories, list):
         directories = [directories]
 
-    directories = list(set(directories))
+    # remove duplicates, keeping the order
+    unique = []
+    for directory in directories:
+        if directory not in unique:
+            unique.append(directory)
 
     projectdict = {}
     treelist = []
+    cols = ["Measurement"]
+    last = time.time()
 
-    for directory in directories:
-        files = find_data(directory)
-
-        cols = ["Measurement"]
-
-        for ff in files:
-            if not verify_dataset(ff):
+    for directory in unique:
+        files = find_data(directory, workers=workers)
+        for ff, meta in zip(files, _imap(get_metadata, files, workers)):
+            if not meta["verified"]:
                 # Ignore broken measurements
                 continue
             path = path_to_str(ff.parent)
-            project = get_sample_name(ff)
+            project = meta["sample"]
             pid = path+project
             # try to find the path in pathdict
             if pid in projectdict:
@@ -54,21 +115,32 @@ def collect_data_tree(directories):
                 # The first element of a tree contains the measurement name
                 treelist[dirindex].append((project, path))
             # Get data from filename
-            mx = get_run_index(ff)
-            chip_region = get_chip_region(ff)
+            mx = meta["run index"]
+            chip_region = meta["chip region"]
             dn = u"M{} {}".format(mx, chip_region)
             if not chip_region.lower() in ["reservoir"]:
                 # outlet (flow rate is not important)
-                dn += u"  {:.5f} µls⁻¹".format(get_flow_rate(ff))
-            dn += "  ({} events)".format(get_event_count(ff))
+                dn += u"  {:.5f} µls⁻¹".format(meta["flow rate"])
+            dn += "  ({} events)".format(meta["event count"])
 
             treelist[dirindex].append((dn, path_to_str(ff)))
 
-    return treelist, cols
+            if interval is not None and time.time() - last > interval:
+                yield [list(item) for item in treelist], cols
+                last = time.time()
+
+    get_metadata_index().flush()
+    get_event_count_index().flush()
+    yield treelist, cols
 
 
-def find_data(path):
-    """Find tdms and rtdc data files in a directory"""
+def find_data(path, workers=SCAN_WORKERS):
+    """Find tdms and rtdc data files in a directory
+
+    The subdirectories are listed and the files are sorted
+    (see `sort_path` below) concurrently with a pool of `workers`
+    threads.
+    """
     path = pathlib.Path(path)
 
     def sort_path(path):
@@ -87,7 +159,10 @@ def find_data(path):
         """
         try:
             # try to get measurement number as an integer
-            idx = get_run_index(path)
+            if path.suffix == ".rtdc":
+                idx = get_metadata(path)["run index"]
+            else:
+                idx = get_run_index(path)
         except BaseException:
             # just use the given path
             name = path.name
@@ -96,12 +171,15 @@ def find_data(path):
             name = "{:09d}_{}".format(idx, path.name)
         return path.with_name(name)
 
-    tdmsfiles = fmt_tdms.get_tdms_files(path)
-    tdmsfiles = sorted(tdmsfiles, key=sort_path)
-    rtdcfiles = [r for r in path.rglob("*.rtdc") if r.is_file()]
-    rtdcfiles = sorted(rtdcfiles, key=sort_path)
-
-    files = [pathlib.Path(ff) for ff in rtdcfiles + tdmsfiles]
+    allfiles = _scan_directory(path, workers=workers)
+    # exclude fluorescence trace files (as `fmt_tdms.get_tdms_files`)
+    tdmsfiles = [ff for ff in allfiles if ff.suffix == ".tdms" and
+                 not ff.name.endswith("_traces.tdms")]
+    rtdcfiles = [ff for ff in allfiles if ff.suffix == ".rtdc"]
+    files = []
+    for ftype in [rtdcfiles, tdmsfiles]:
+        keys = list(_imap(sort_path, ftype, workers))
+        files += [ff for _, ff in sorted(zip(keys, ftype))]
     return files
 
 
@@ -181,33 +259,100 @@ def get_event_count_cache(fname):
 
     Notes
     -----
-    The values for a file name are cached on disk using
-    the file name and the first 100kB of the file as a
-    key.
+    The values are cached on disk (see :func:`get_event_count_index`).
+    They are looked up using the path, size, and modification time
+    of the file and, if the file changed, using the file name and
+    the first 100kB of the file as a key.
     """
     fname = pathlib.Path(fname).resolve()
     ext = fname.suffix
-    # Generate key
-    with fname.open(mode="rb") as fd:
-        data = fd.read(100 * 1024)
-    strfname = str(fname).encode("zip")
-    fhash = hashlib.md5(data + strfname).hexdigest()
-    cfgec = settings.SettingsFileCache(name="shapeout_tdms_event_counts.txt")
-    try:
-        event_count = cfgec.get_int(fhash)
-    except KeyError:
-        if ext == ".avi":
-            with imageio.get_reader(fname) as video:
-                event_count = len(video)
-        elif ext == ".tdms":
-            tdmsfd = nptdms.TdmsFile(path_to_str(fname))
-            event_count = len(tdmsfd["Cell Track"]["time"].data)
-        else:
-            raise ValueError("unsupported file extension: {}".format(ext))
-        cfgec.set_int(fhash, event_count)
+    index = get_event_count_index()
+    stat = get_stat([fname])
+    event_count = index.get(fname, stat)
+    if event_count is None:
+        # Generate key
+        with fname.open(mode="rb") as fd:
+            data = fd.read(100 * 1024)
+        strfname = str(fname).encode("zip")
+        fhash = hashlib.md5(data + strfname).hexdigest()
+        event_count = index.get_hash(fhash)
+        if event_count is None:
+            if ext == ".avi":
+                with imageio.get_reader(fname) as video:
+                    event_count = len(video)
+            elif ext == ".tdms":
+                tdmsfd = nptdms.TdmsFile(path_to_str(fname))
+                event_count = len(tdmsfd["Cell Track"]["time"].data)
+            else:
+                raise ValueError("unsupported file extension: {}".format(ext))
+        index.set(fname, stat, event_count, content_hash=fhash)
     return event_count
 
 
+def get_event_count_index():
+    """Return the persistent index used by :func:`get_event_count_cache`
+
+    Event counts of the text file-based cache of previous versions
+    are imported when the index is created.
+    """
+    if not _EVENT_COUNT_INDEX:
+        index = FileIndex("shapeout_event_counts.sqlite")
+        old = pathlib.Path(appdirs.user_cache_dir()) / \
+            "shapeout_tdms_event_counts.txt"
+        if old.exists():
+            cfgec = settings.SettingsFileCache(name=old.name)
+            for fhash, value in cfgec.load().items():
+                if value.isdigit():
+                    index.set_hash(fhash, int(value))
+            index.flush()
+            old.rename(old.with_suffix(".txt.imported"))
+        _EVENT_COUNT_INDEX.append(index)
+    return _EVENT_COUNT_INDEX[0]
+
+
+def get_metadata(fname, index=None):
+    """Get the metadata of a data set displayed in the data browser
+
+    All metadata are extracted in a single pass over the data files
+    (e.g. the hdf5 file is opened only once). The results are stored
+    in a persistent index, such that data sets that did not change
+    (same size and modification time) are not read again.
+
+    Parameters
+    ----------
+    fname: str
+        Path to an experimental data file. The file format is
+        determined from the file extension (tdms or rtdc).
+    index: shapeout.util.file_index.FileIndex or None
+        Metadata index to use; defaults to :func:`get_metadata_index`
+
+    Returns
+    -------
+    meta: dict
+        Dictionary with the key "verified" (see
+        :func:`verify_dataset`) and, if the data set is usable,
+        the keys "chip region", "event count", "flow rate",
+        "run index", and "sample" (see the corresponding
+        `get_*` functions).
+    """
+    fname = pathlib.Path(fname).resolve()
+    if index is None:
+        index = get_metadata_index()
+    stat = get_stat(_get_measurement_files(fname))
+    meta = index.get(fname, stat)
+    if meta is None:
+        meta = _extract_metadata(fname)
+        index.set(fname, stat, meta)
+    return meta
+
+
+def get_metadata_index():
+    """Return the persistent index used by :func:`get_metadata`"""
+    if not _METADATA_INDEX:
+        _METADATA_INDEX.append(FileIndex("shapeout_metadata_index.sqlite"))
+    return _METADATA_INDEX[0]
+
+
 def get_flow_rate(fname):
     """Get the flow rate of a data set
 
@@ -247,6 +392,16 @@ def get_flow_rate(fname):
     return flow_rate
 
 
+def flush_indexes():
+    """Write pending values of the persistent indexes to disk
+
+    This is done automatically when the interpreter exits, but not
+    if it is terminated with :func:`os._exit`.
+    """
+    for index in _METADATA_INDEX + _EVENT_COUNT_INDEX:
+        index.flush()
+
+
 def get_chip_region(fname):
     """Get the chip region of a data set
 
@@ -302,6 +457,60 @@ def get_sample_name(fname):
     return sample
 
 
+def _extract_metadata(fname):
+    """Extract the metadata for :func:`get_metadata`"""
+    meta = {"verified": False}
+    if fname.suffix == ".rtdc":
+        try:
+            with h5py.File(path_to_str(fname), mode="r") as h5:
+                if all([key in h5.attrs for key in RTDC_KEYS]):
+                    attrs = dict((key, h5.attrs[key]) for key in RTDC_KEYS)
+                else:
+                    return meta
+        except IOError:
+            return meta
+        sample = attrs["experiment:sample"]
+        region = attrs["setup:chip region"]
+        if isinstance(sample, bytes):
+            sample = sample.decode("utf-8")
+        if isinstance(region, bytes):
+            region = region.decode("utf-8")
+        meta["chip region"] = region.lower()
+        meta["event count"] = int(attrs["experiment:event count"])
+        meta["flow rate"] = float(attrs["setup:flow rate"])
+        meta["run index"] = int(attrs["experiment:run index"])
+        meta["sample"] = sample
+    elif fname.suffix == ".tdms":
+        mx = fname.name.split("_")[0]
+        para = fname.parent / (mx + "_para.ini")
+        camera = fname.parent / (mx + "_camera.ini")
+        if not (para.exists() and camera.exists() and fname.exists()):
+            return meta
+        try:
+            camcfg = rt_config.load_from_file(path_to_str(para))
+            meta["chip region"] = camcfg["general"]["region"].lower()
+            meta["flow rate"] = float(camcfg["general"]["flow rate [ul/s]"])
+            meta["event count"] = int(get_event_count(fname))
+            meta["run index"] = get_run_index(fname)
+            meta["sample"] = fmt_tdms.get_project_name_from_path(fname)
+        except BaseException:
+            return {"verified": False}
+    else:
+        return meta
+    meta["verified"] = True
+    return meta
+
+
+def _get_measurement_files(fname):
+    """Return all files that determine the metadata of a data set"""
+    files = [fname]
+    if fname.suffix == ".tdms":
+        mx = fname.name.split("_")[0]
+        for suffix in ["_para.ini", "_camera.ini", "_log.ini", "_imaq.avi"]:
+            files.append(fname.parent / (mx + suffix))
+    return files
+
+
 def verify_dataset(path, verbose=False):
     """Returns `True` if the data set is complete/usable"""
     path = pathlib.Path(path).resolve()
@@ -332,14 +541,7 @@ def verify_dataset(path, verbose=False):
     elif path.suffix == ".rtdc":
         try:
             with h5py.File(path_to_str(path), mode="r") as h5:
-                for key in ["experiment:event count",
-                            "experiment:sample",
-                            "experiment:run index",
-                            "imaging:pixel size",
-                            "setup:channel width",
-                            "setup:chip region",
-                            "setup:flow rate",
-                            ]:
+                for key in RTDC_KEYS:
                     if key not in h5.attrs:
                         if verbose:
                             print("fmt_rtdc keys missing")
@@ -357,3 +559,65 @@ def verify_dataset(path, verbose=False):
         is_ok = False
 
     return is_ok
+
+
+def _imap(func, items, workers):
+    """Apply `func` to `items` using up to `workers` threads
+
+    The results are yielded in the order of `items` as soon as
+    they are available.
+    """
+    items = list(items)
+    workers = min(workers, len(items))
+    if workers <= 1:
+        for it in items:
+            yield func(it)
+        return
+    pool = ThreadPool(processes=workers)
+    try:
+        for res in pool.imap(func, items):
+            yield res
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _list_directory(path):
+    """Return the files and the subdirectories of a directory"""
+    files = []
+    subdirs = []
+    try:
+        entries = list(path.iterdir())
+    except OSError:
+        # e.g. permission denied
+        return files, subdirs
+    for pp in entries:
+        if pp.is_dir():
+            subdirs.append(pp)
+        elif pp.is_file():
+            files.append(pp)
+    return files, subdirs
+
+
+def _scan_directory(path, workers=SCAN_WORKERS):
+    """Return all files in a directory and its subdirectories
+
+    The directories of each level of the directory tree are
+    listed concurrently.
+    """
+    files = []
+    visited = set([path.resolve()])
+    level = [path]
+    while level:
+        subdirs = []
+        for dfiles, ddirs in _imap(_list_directory, level, workers):
+            files += dfiles
+            subdirs += ddirs
+        level = []
+        for dd in subdirs:
+            # do not follow symbolic links in circles
+            real = dd.resolve()
+            if real not in visited:
+                visited.add(real)
+                level.append(dd)
+    return sorted(files)
@@ -12,9 +12,13 @@ import appdirs
 NAME = "shapeout.cfg"
 
 #: default configuration parameters
-DEFAULTS = {"autosave session": True,
+DEFAULTS = {"analysis memory budget mb": 0,
+            "analysis workers": 1,
+            "autosave session": True,
             "check update": True,
             "expert mode": False,
+            "plot contour workers": 1,
+            "plot progressive": True,
             }
 
 #: data features only visible in expert mode
@@ -84,6 +88,8 @@ class SettingsFile(object):
             if not val.isdigit():
                 raise ValueError("Config key '{}' is no integer!".format(key))
             ret = int(val)
+        elif key in self.defaults:
+            ret = int(self.defaults[key])
         else:
             raise KeyError("Config key `{}` not set!".format(key))
         return ret
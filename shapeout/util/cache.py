@@ -0,0 +1,116 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Caching helpers for data derived from RT-DC datasets"""
+from __future__ import division, unicode_literals
+
+import collections
+import threading
+
+from dclab.rtdc_dataset.ancillaries import AncillaryFeature
+from dclab.util import hashobj
+import numpy as np
+
+
+#: serializes the access to the data and filters of RT-DC datasets
+#: (dclab is not thread-safe); background threads must read the
+#: filtered data and compute cache keys (e.g. with
+#: :func:`get_filter_fingerprint`) while holding this lock, and
+#: filters must only be applied while holding it
+DATASET_LOCK = threading.RLock()
+
+
+class LRUCache(object):
+    def __init__(self, maxsize=100):
+        """Thread-safe, dictionary-like least-recently-used cache
+
+        Parameters
+        ----------
+        maxsize: int
+            Maximum number of items in the cache; when a new item
+            is added to a full cache, the least recently used item
+            is removed.
+        """
+        self.maxsize = maxsize
+        self._data = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __getitem__(self, key):
+        with self._lock:
+            # move item to the end (most recently used)
+            value = self._data.pop(key)
+            self._data[key] = value
+            return value
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def __setitem__(self, key, value):
+        with self._lock:
+            if key in self._data:
+                self._data.pop(key)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Remove all items from the cache"""
+        with self._lock:
+            self._data.clear()
+
+    def resize(self, maxsize):
+        """Set the maximum number of items in the cache
+
+        If the cache holds more than `maxsize` items, the least
+        recently used items are removed.
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get(self, key, default=None):
+        """Return the value for `key` or `default` if not cached"""
+        with self._lock:
+            if key in self._data:
+                return self[key]
+            else:
+                return default
+
+
+def get_dataset_key(rtdc_ds):
+    """Return a reproducible key identifying the data of a dataset
+
+    Notes
+    -----
+    The hash of dictionary-based datasets is computed from a single
+    feature only. For those, the identifier is used in addition.
+    """
+    if rtdc_ds.format == "dict":
+        key = "{}_{}".format(rtdc_ds.hash, rtdc_ds.identifier)
+    else:
+        key = rtdc_ds.hash
+    return key
+
+
+def get_feature_key(rtdc_ds, feat):
+    """Return a reproducible key identifying the data of a feature
+
+    Ancillary features (e.g. "emodulus") depend on the configuration
+    of the dataset; their dclab hash is included in the key.
+    """
+    tohash = [get_dataset_key(rtdc_ds), feat]
+    if feat not in rtdc_ds._events:
+        ancol = AncillaryFeature.available_features(rtdc_ds)
+        if feat in ancol:
+            tohash.append(ancol[feat].hash(rtdc_ds))
+    return hashobj(tohash)
+
+
+def get_filter_fingerprint(rtdc_ds):
+    """Return a hash of the current filter (`rtdc_ds.filter.all`)"""
+    return hashobj(np.packbits(rtdc_ds.filter.all))
@@ -0,0 +1,162 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Cached and prefetched event images for the event viewer"""
+from __future__ import division, unicode_literals
+
+import functools
+
+import numpy as np
+from scipy.ndimage import binary_erosion
+
+from .cache import DATASET_LOCK, LRUCache
+from .progressive import Refiner
+
+
+#: serializes the access to the event data (the file readers of
+#: dclab are not thread-safe)
+DECODE_LOCK = DATASET_LOCK
+
+
+class EventImageCache(object):
+    def __init__(self, rtdc_ds, maxsize=200, prefetch=10):
+        """Least-recently-used cache of the event images of a dataset
+
+        Decoding event images (e.g. from the video file of a tdms
+        measurement) and computing the contour from the mask is
+        slow compared to displaying them. This class caches the
+        images and contours of the events and decodes the neighbors
+        of the displayed event in the background
+        (see :func:`EventImageCache.prefetch`).
+
+        Parameters
+        ----------
+        rtdc_ds: RTDCBase
+            Dataset with the "image" and (optionally) "mask" feature
+        maxsize: int
+            Maximum number of cached events
+        prefetch: int
+            Number of events before and after the displayed event
+            that are prefetched (see :func:`get_prefetch_order`)
+        """
+        self.rtdc_ds = rtdc_ds
+        self.prefetch_count = prefetch
+        self._cache = LRUCache(maxsize=maxsize)
+        self._refiner = Refiner()
+
+    def _decode(self, evt_id):
+        """Return the cached event or decode and cache it"""
+        with DECODE_LOCK:
+            if evt_id in self._cache:
+                return self._cache[evt_id]
+            ds = self.rtdc_ds
+            image = ds["image"][evt_id]
+            if np.all(np.isnan(image)):
+                # No image data - use white image
+                image = 255*np.ones_like(image, dtype=np.uint8)
+            if "mask" in ds and len(ds["mask"]) > evt_id:
+                mask = ds["mask"][evt_id]
+                contour = mask ^ binary_erosion(mask)
+            else:
+                contour = None
+            self._cache[evt_id] = image, contour
+        return image, contour
+
+    def cancel(self):
+        """Cancel prefetching"""
+        self._refiner.cancel()
+
+    def get(self, evt_id):
+        """Return image and contour of an event
+
+        Returns
+        -------
+        image: 2d ndarray
+            Gray scale event image
+        contour: 2d boolean ndarray or None
+            Contour pixels computed from the event mask; None if
+            the dataset does not contain masks.
+        """
+        return self._decode(evt_id)
+
+    def get_rgb(self, evt_id, contour=True):
+        """Return the RGB event image with the contour drawn in red"""
+        image, cont = self.get(evt_id)
+        # Convert to RGB
+        rgb = np.repeat(image[:, :, np.newaxis], 3, axis=2)
+        if contour and cont is not None:
+            rgb[cont] = (255, 0, 0)
+        return rgb
+
+    def prefetch(self, evt_id):
+        """Decode the neighbors of an event in the background
+
+        Events already cached are skipped. Prefetching of the
+        neighbors of a previously displayed event is cancelled.
+        """
+        size = len(self.rtdc_ds["image"])
+        filtered = np.where(self.rtdc_ds.filter.all[:size])[0]
+        jobs = []
+        for idx in get_prefetch_order(evt_id, size, self.prefetch_count,
+                                      filtered=filtered):
+            if idx not in self._cache:
+                jobs.append((functools.partial(self._decode, idx),
+                             _ignore))
+        if jobs:
+            self._refiner.start(jobs)
+        else:
+            self._refiner.cancel()
+
+    def wait(self, timeout=None):
+        """Wait until prefetching is done"""
+        self._refiner.wait(timeout)
+
+
+def get_prefetch_order(evt_id, size, count, filtered=None):
+    """Return the events to prefetch when `evt_id` is displayed
+
+    Parameters
+    ----------
+    evt_id: int
+        Index of the displayed event
+    size: int
+        Number of events
+    count: int
+        Number of events before and after `evt_id` to prefetch
+    filtered: 1d ndarray of int or None
+        Sorted indices of the filtered events; if given, the
+        `count` filtered events before and after `evt_id` are
+        prefetched as well.
+
+    Returns
+    -------
+    events: list of int
+        Event indices, the closest neighbors first
+    """
+    events = []
+    if filtered is not None and len(filtered):
+        pos = np.searchsorted(filtered, evt_id)
+        # the filtered events after and before `evt_id`
+        after = filtered[pos:]
+        after = after[after != evt_id][:count]
+        before = filtered[:pos][::-1][:count]
+    else:
+        after = before = []
+    for ii in range(count):
+        for idx in [evt_id + ii + 1, evt_id - ii - 1]:
+            if 0 <= idx < size:
+                events.append(idx)
+        for aa in [after, before]:
+            if ii < len(aa):
+                events.append(int(aa[ii]))
+    # remove duplicates, keeping the order
+    seen = set([evt_id])
+    unique = []
+    for idx in events:
+        if idx not in seen:
+            seen.add(idx)
+            unique.append(idx)
+    return unique
+
+
+def _ignore(result):
+    pass
@@ -0,0 +1,231 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Persistent index of values derived from data files"""
+from __future__ import division, unicode_literals
+
+import atexit
+import contextlib
+import json
+import logging
+import pathlib
+import sqlite3
+import threading
+
+import appdirs
+
+from .spath import path_to_str
+
+
+logger = logging.getLogger(__name__)
+
+
+class FileIndex(object):
+    def __init__(self, name, directory=None, batch_size=100):
+        """SQLite-based index of values derived from files
+
+        The values (e.g. metadata extracted from a measurement) are
+        stored with the path, size, and modification time of the
+        file. A stored value is only returned if size and modification
+        time did not change, i.e. files that did not change do not
+        have to be read again. Optionally, values are also stored
+        with a hash of the file content (see :func:`FileIndex.get_hash`),
+        which is only computed if the size and modification time of
+        a file changed.
+
+        New values are written in batches (see :func:`FileIndex.flush`).
+        The database may be accessed from several threads and several
+        processes at the same time.
+
+        Parameters
+        ----------
+        name: str
+            File name of the database
+        directory: str or pathlib.Path or None
+            Directory of the database; defaults to the user's cache
+            directory
+        batch_size: int
+            Number of pending values that triggers writing to the
+            database
+        """
+        if directory is None:
+            directory = appdirs.user_cache_dir()
+        directory = pathlib.Path(directory)
+        if not directory.exists():
+            directory.mkdir(parents=True)
+        self.path = directory / name
+        self.batch_size = batch_size
+        self._pending = {}
+        self._pending_hashes = {}
+        self._lock = threading.Lock()
+        try:
+            with self._connect() as conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS files ("
+                             "path TEXT PRIMARY KEY, size INTEGER, "
+                             "mtime REAL, value TEXT)")
+                conn.execute("CREATE TABLE IF NOT EXISTS hashes ("
+                             "hash TEXT PRIMARY KEY, value TEXT)")
+                conn.commit()
+        except sqlite3.Error:
+            logger.exception("Could not create {}!".format(self.path))
+        # write pending values when the interpreter exits
+        atexit.register(self.flush)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        # Connections cannot be shared between threads; connecting
+        # is cheap compared to reading a data file.
+        conn = sqlite3.connect(path_to_str(self.path), timeout=30)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def _check_batch(self):
+        with self._lock:
+            full = (len(self._pending) + len(self._pending_hashes)
+                    >= self.batch_size)
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write all pending values to the database"""
+        with self._lock:
+            pending = self._pending
+            pending_hashes = self._pending_hashes
+            self._pending = {}
+            self._pending_hashes = {}
+        if not pending and not pending_hashes:
+            return
+        rows = [(key, size, mtime, value)
+                for key, (size, mtime, value) in pending.items()]
+        try:
+            # all values are written in one transaction
+            with self._connect() as conn:
+                conn.executemany("INSERT OR REPLACE INTO files "
+                                 "(path, size, mtime, value) "
+                                 "VALUES (?, ?, ?, ?)", rows)
+                conn.executemany("INSERT OR REPLACE INTO hashes "
+                                 "(hash, value) VALUES (?, ?)",
+                                 list(pending_hashes.items()))
+                conn.commit()
+        except sqlite3.Error:
+            logger.exception("Could not write to {}!".format(self.path))
+
+    def get(self, path, stat):
+        """Return the stored value of a file
+
+        Parameters
+        ----------
+        path: str or pathlib.Path
+            Path of the file
+        stat: tuple
+            Size and modification time of the file (see
+            :func:`get_stat`)
+
+        Returns
+        -------
+        value: object or None
+            The stored value or None if there is no value for
+            the current size and modification time of the file
+        """
+        key = _get_key(path)
+        size, mtime = stat
+        with self._lock:
+            pending = self._pending.get(key)
+        if pending is not None:
+            row = pending
+        else:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute("SELECT size, mtime, value FROM files "
+                                       "WHERE path=?", (key,)).fetchone()
+            except sqlite3.Error:
+                logger.exception("Could not read from {}!".format(self.path))
+                row = None
+        if row is not None and row[0] == size and row[1] == mtime:
+            return json.loads(row[2])
+        else:
+            return None
+
+    def get_hash(self, content_hash):
+        """Return the value stored for a hash of the file content
+
+        Returns
+        -------
+        value: object or None
+            The stored value or None if there is no value for
+            `content_hash`
+        """
+        with self._lock:
+            value = self._pending_hashes.get(content_hash)
+        if value is None:
+            try:
+                with self._connect() as conn:
+                    row = conn.execute("SELECT value FROM hashes "
+                                       "WHERE hash=?",
+                                       (content_hash,)).fetchone()
+            except sqlite3.Error:
+                logger.exception("Could not read from {}!".format(self.path))
+                row = None
+            if row is not None:
+                value = row[0]
+        if value is not None:
+            return json.loads(value)
+        else:
+            return None
+
+    def set(self, path, stat, value, content_hash=None):
+        """Store the value of a file
+
+        The value must be JSON-serializable. It is written to the
+        database with the next batch. If `content_hash` is given,
+        the value is also stored for this hash of the file content.
+        """
+        key = _get_key(path)
+        size, mtime = stat
+        with self._lock:
+            self._pending[key] = (size, mtime, json.dumps(value))
+        if content_hash is None:
+            self._check_batch()
+        else:
+            self.set_hash(content_hash, value)
+
+    def set_hash(self, content_hash, value):
+        """Store a value for a hash of a file content"""
+        with self._lock:
+            self._pending_hashes[content_hash] = json.dumps(value)
+        self._check_batch()
+
+
+def get_stat(paths):
+    """Return the combined size and modification time of files
+
+    Parameters
+    ----------
+    paths: list of pathlib.Path
+        Files that make up a measurement; files that do not
+        exist are ignored.
+
+    Returns
+    -------
+    stat: tuple
+        Total size and latest modification time of the files
+    """
+    size = 0
+    mtime = 0
+    for pp in paths:
+        try:
+            st = pp.stat()
+        except OSError:
+            continue
+        size += st.st_size
+        mtime = max(mtime, st.st_mtime)
+    return size, mtime
+
+
+def _get_key(path):
+    key = path_to_str(pathlib.Path(path).resolve())
+    if isinstance(key, bytes):
+        # Python 2
+        key = key.decode("utf-8")
+    return key
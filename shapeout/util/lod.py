@@ -0,0 +1,184 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Spatial index of scatter data (level of detail and event picking)"""
+from __future__ import division, unicode_literals
+
+import numpy as np
+
+
+class ScatterIndex(object):
+    def __init__(self, x, y, bins=256):
+        """Grid-based spatial index of two-dimensional scatter data
+
+        The events are sorted by the cells of a regular grid
+        spanning the data, such that the events inside a rectangular
+        window can be found without looking at all events. This is
+        used to downsample the events that are visible in a zoomed
+        plot (see :func:`ScatterIndex.downsample`) and to find the
+        event closest to a clicked point
+        (see :func:`ScatterIndex.nearest`).
+
+        Parameters
+        ----------
+        x, y: 1d ndarrays
+            Event coordinates on the plotting scale (e.g. the
+            logarithm for logarithmic axes); events with nan or
+            inf values are not indexed.
+        bins: int
+            Number of grid cells along each axis
+        """
+        valid = np.isfinite(x) & np.isfinite(y)
+        #: indices of the indexed events in `x` and `y`
+        self.events = np.where(valid)[0]
+        x = x[valid]
+        y = y[valid]
+        self.bins = bins
+        if x.size:
+            self.range = (x.min(), x.max(), y.min(), y.max())
+        else:
+            self.range = (0, 1, 0, 1)
+        ix = self._get_bin(x, self.range[0], self.range[1])
+        iy = self._get_bin(y, self.range[2], self.range[3])
+        # fixed random ranks for deterministic downsampling
+        rs = np.random.RandomState(seed=47)
+        rank = rs.permutation(x.size)
+        # sort by grid cell (column-major in x)
+        order = np.lexsort((rank, iy, ix))
+        self.x = x[order]
+        self.y = y[order]
+        self.rank = rank[order]
+        self.events = self.events[order]
+        cells = ix[order] * bins + iy[order]
+        #: start index of each cell in the sorted arrays
+        self.offsets = np.searchsorted(cells, np.arange(bins**2 + 1))
+
+    def _get_bin(self, a, amin, amax):
+        if amax > amin:
+            idx = ((a - amin) / (amax - amin) * self.bins).astype(np.int64)
+        else:
+            idx = np.zeros(a.size, dtype=np.int64)
+        return np.clip(idx, 0, self.bins - 1)
+
+    def _get_bin_range(self, low, high, amin, amax):
+        """Indices of the first and last grid cell overlapping a range"""
+        if high < amin or low > amax:
+            return None
+        low = max(low, amin)
+        high = min(high, amax)
+        ilow, ihigh = self._get_bin(np.array([low, high]), amin, amax)
+        return ilow, ihigh
+
+    def nearest(self, x, y, xscale=1, yscale=1):
+        """Return the event closest to a point
+
+        The distance of an event at `(xi, yi)` to the point is
+        `sqrt(((xi - x)/xscale)**2 + ((yi - y)/yscale)**2)`, i.e.
+        `xscale` and `yscale` should be set to the visible plotting
+        range to find the event closest on the screen.
+
+        Parameters
+        ----------
+        x, y: float
+            Point on the plotting scale
+        xscale, yscale: float
+            Normalization of the distances along x and y
+
+        Returns
+        -------
+        event: int or None
+            Index of the closest event in the arrays `x` and `y`
+            used to create this index; None if no events are indexed
+            or if the point is not finite.
+        """
+        if self.events.size == 0 or not (np.isfinite(x) and np.isfinite(y)):
+            return None
+        # Search windows of increasing size until the closest event
+        # in the window is closer than any event outside of it.
+        xmin, xmax, ymin, ymax = self.range
+        radius = max((xmax - xmin) / self.bins / xscale,
+                     (ymax - ymin) / self.bins / yscale)
+        if radius <= 0:
+            radius = 1
+        while True:
+            wxmin, wxmax = x - radius * xscale, x + radius * xscale
+            wymin, wymax = y - radius * yscale, y + radius * yscale
+            idx = self.query(wxmin, wxmax, wymin, wymax)
+            if idx.size:
+                dist = np.hypot((self.x[idx] - x) / xscale,
+                                (self.y[idx] - y) / yscale)
+                best = np.argmin(dist)
+                covered = (wxmin <= xmin and wxmax >= xmax and
+                           wymin <= ymin and wymax >= ymax)
+                if dist[best] <= radius or covered:
+                    return int(self.events[idx[best]])
+            radius *= 2
+
+    def query(self, xmin, xmax, ymin, ymax):
+        """Return the events inside a rectangular window
+
+        Returns
+        -------
+        idx: 1d ndarray
+            Indices into the sorted arrays `self.x`, `self.y`,
+            `self.rank`, and `self.events`
+        """
+        bx = self._get_bin_range(xmin, xmax, self.range[0], self.range[1])
+        by = self._get_bin_range(ymin, ymax, self.range[2], self.range[3])
+        if bx is None or by is None:
+            return np.zeros(0, dtype=np.int64)
+        # The cells of a grid column within the window are contiguous.
+        cols = np.arange(bx[0], bx[1] + 1) * self.bins
+        starts = self.offsets[cols + by[0]]
+        stops = self.offsets[cols + by[1] + 1]
+        idx = np.concatenate([np.arange(a, b) for a, b in zip(starts, stops)])
+        # exact window
+        inside = ((self.x[idx] >= xmin) & (self.x[idx] <= xmax) &
+                  (self.y[idx] >= ymin) & (self.y[idx] <= ymax))
+        return idx[inside]
+
+    def downsample(self, xmin, xmax, ymin, ymax, samples, grid_size=300):
+        """Downsample the events inside a rectangular window
+
+        The selection follows :func:`dclab.downsampling.downsample_grid`
+        (which is used for the full plotting range): one event is
+        taken from each occupied cell of a grid of `grid_size` x
+        `grid_size` cells spanning the window; then events are
+        pseudo-randomly added or removed to match `samples`.
+
+        Parameters
+        ----------
+        xmin, xmax, ymin, ymax: float
+            Window on the plotting scale
+        samples: int
+            Number of events to return; set to 0 to return all
+            events inside the window.
+
+        Returns
+        -------
+        events: 1d ndarray
+            Sorted indices of the selected events in the arrays
+            `x` and `y` used to create this index
+        """
+        idx = self.query(xmin, xmax, ymin, ymax)
+        if samples and idx.size > samples:
+            # events in order of their random rank
+            idx = idx[np.argsort(self.rank[idx], kind="mergesort")]
+            gx = self._window_bin(self.x[idx], xmin, xmax, grid_size)
+            gy = self._window_bin(self.y[idx], ymin, ymax, grid_size)
+            # first event (lowest rank) of each grid cell
+            _, first = np.unique(gx * grid_size + gy, return_index=True)
+            keep = np.zeros(idx.size, dtype=bool)
+            keep[first] = True
+            # add or remove the events with the lowest ranks
+            order = np.concatenate([np.sort(first),
+                                    np.where(~keep)[0]])
+            idx = idx[order[:samples]]
+        return np.sort(self.events[idx])
+
+    @staticmethod
+    def _window_bin(a, amin, amax, size):
+        if amax > amin:
+            idx = ((a - amin) / (amax - amin) * size).astype(np.int64)
+        else:
+            idx = np.zeros(a.size, dtype=np.int64)
+        return np.clip(idx, 0, size - 1)
@@ -0,0 +1,157 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Memory management of feature data held by RT-DC datasets"""
+from __future__ import division, unicode_literals
+
+import collections
+import threading
+
+import numpy as np
+
+
+class MemoryBudget(object):
+    def __init__(self, maxbytes=0):
+        """Least-recently-used eviction of ancillary feature columns
+
+        Ancillary features (e.g. "emodulus" or "volume") are computed
+        by dclab on first access and kept in `RTDCBase._ancillaries`.
+        Datasets registered with this class have their ancillary
+        features tracked; when the total size of the tracked features
+        exceeds `maxbytes`, the least recently used features are
+        removed from their datasets. dclab transparently computes
+        them again when they are accessed the next time.
+
+        Parameters
+        ----------
+        maxbytes: int
+            Memory budget in bytes; set to 0 to disable eviction.
+
+        Notes
+        -----
+        The feature columns of hdf5-based datasets are read from disk
+        on each access and thus do not count towards the budget.
+        """
+        self.maxbytes = maxbytes
+        # (id of column dictionary, feature) -> (columns, size in bytes)
+        self._entries = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    @property
+    def nbytes(self):
+        """Total size of all tracked feature columns in bytes"""
+        with self._lock:
+            return sum([nb for _, nb in self._entries.values()])
+
+    def _add(self, columns, feat, nbytes):
+        with self._lock:
+            key = (id(columns), feat)
+            self._entries.pop(key, None)
+            self._entries[key] = (columns, nbytes)
+            self.enforce(keep=[key])
+
+    def _remove(self, columns, feat):
+        with self._lock:
+            self._entries.pop((id(columns), feat), None)
+
+    def _touch(self, columns, feat):
+        with self._lock:
+            key = (id(columns), feat)
+            if key in self._entries:
+                self._entries[key] = self._entries.pop(key)
+
+    def enforce(self, keep=[]):
+        """Evict least recently used features until within budget
+
+        Parameters
+        ----------
+        keep: list
+            Entry keys that must not be evicted (e.g. the feature
+            that was just computed)
+        """
+        if not self.maxbytes:
+            return
+        with self._lock:
+            total = self.nbytes
+            for key in list(self._entries.keys()):
+                if total <= self.maxbytes:
+                    break
+                if key in keep:
+                    continue
+                columns, nbytes = self._entries.pop(key)
+                dict.pop(columns, key[1], None)
+                total -= nbytes
+
+    def register(self, rtdc_ds):
+        """Track the ancillary feature columns of a dataset"""
+        with self._lock:
+            anc = rtdc_ds._ancillaries
+            if isinstance(anc, TrackedColumns) and anc.budget is self:
+                return
+            tracked = TrackedColumns(self)
+            for feat in list(anc.keys()):
+                tracked[feat] = anc[feat]
+            rtdc_ds._ancillaries = tracked
+
+    def unregister(self, rtdc_ds):
+        """Stop tracking the ancillary features of a dataset"""
+        with self._lock:
+            anc = rtdc_ds._ancillaries
+            if isinstance(anc, TrackedColumns) and anc.budget is self:
+                for feat in list(anc.keys()):
+                    self._remove(anc, feat)
+                rtdc_ds._ancillaries = dict(anc)
+
+
+class TrackedColumns(dict):
+    def __init__(self, budget):
+        """Dictionary of ancillary features that reports to a budget
+
+        dclab stores ancillary features as `(hash, data)` tuples.
+        """
+        super(TrackedColumns, self).__init__()
+        self.budget = budget
+
+    def __delitem__(self, feat):
+        super(TrackedColumns, self).__delitem__(feat)
+        self.budget._remove(self, feat)
+
+    def __getitem__(self, feat):
+        value = super(TrackedColumns, self).__getitem__(feat)
+        self.budget._touch(self, feat)
+        return value
+
+    def __setitem__(self, feat, value):
+        super(TrackedColumns, self).__setitem__(feat, value)
+        self.budget._add(self, feat, _get_nbytes(value[1]))
+
+
+def _get_nbytes(data):
+    if isinstance(data, np.ndarray):
+        nbytes = data.nbytes
+    else:
+        nbytes = 0
+    return nbytes
+
+
+def get_memory_usage(rtdc_ds):
+    """Return the size of the feature data held in memory in bytes
+
+    This includes feature columns stored in memory (dictionary- and
+    tdms-based datasets), computed ancillary features, and loaded
+    fluorescence traces. Data read on demand from disk (hdf5 feature
+    columns, images) is not taken into account.
+    """
+    nbytes = 0
+    if isinstance(rtdc_ds._events, dict):
+        for feat in rtdc_ds._events:
+            nbytes += _get_nbytes(rtdc_ds._events[feat])
+        trace = rtdc_ds._events.get("trace")
+        if getattr(trace, "_trace", None) is not None:
+            for key in trace._trace:
+                nbytes += _get_nbytes(trace._trace[key])
+    for feat in list(rtdc_ds._ancillaries.keys()):
+        # use `dict.get` to not affect the eviction order
+        value = dict.get(rtdc_ds._ancillaries, feat)
+        if value is not None:
+            nbytes += _get_nbytes(value[1])
+    return nbytes
@@ -0,0 +1,100 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""Background refinement of preliminary plot data"""
+from __future__ import division, unicode_literals
+
+import logging
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class Refiner(object):
+    def __init__(self, deliver=None):
+        """Compute plot data in the background and hand them over
+
+        Plots are first drawn with cheap, preliminary data. A list
+        of refinement jobs is then passed to :func:`Refiner.start`.
+        Each job is a tuple `(compute, apply)` of two callables:
+        `compute()` is called in a background thread and its return
+        value is passed to `apply(result)` via `deliver`.
+
+        Starting new jobs or calling :func:`Refiner.cancel` cancels
+        all jobs that were started before: their remaining `compute`
+        functions are not called anymore and results that are still
+        computed are discarded.
+
+        Parameters
+        ----------
+        deliver: callable or None
+            Function `deliver(func, *args)` that calls `func(*args)`
+            in the thread that owns the plots, e.g. `wx.CallAfter`.
+            If set to None, `apply` is called in the background thread.
+        """
+        if deliver is None:
+            deliver = _call
+        self.deliver = deliver
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def running(self):
+        """True if refinement jobs are being computed"""
+        return self._thread is not None and self._thread.is_alive()
+
+    def _apply(self, generation, apply, result):
+        # called via `self.deliver`
+        if self.is_current(generation):
+            apply(result)
+
+    def _run(self, generation, jobs):
+        for compute, apply in jobs:
+            if not self.is_current(generation):
+                break
+            try:
+                result = compute()
+            except BaseException:
+                logger.exception("Refinement of plot data failed!")
+                break
+            if not self.is_current(generation):
+                break
+            self.deliver(self._apply, generation, apply, result)
+
+    def cancel(self):
+        """Cancel all refinement jobs"""
+        with self._lock:
+            self.generation += 1
+
+    def is_current(self, generation):
+        """Return True if the jobs of `generation` were not cancelled"""
+        with self._lock:
+            return generation == self.generation
+
+    def start(self, jobs):
+        """Cancel running jobs and start refinement of `jobs`
+
+        Returns
+        -------
+        generation: int
+            Identifier of the started jobs (see
+            :func:`Refiner.is_current`)
+        """
+        with self._lock:
+            self.generation += 1
+            generation = self.generation
+        thread = threading.Thread(target=self._run, args=(generation, jobs))
+        thread.daemon = True
+        thread.start()
+        self._thread = thread
+        return generation
+
+    def wait(self, timeout=None):
+        """Wait until the jobs that were started last are done"""
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+def _call(func, *args):
+    return func(*args)
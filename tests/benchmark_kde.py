@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Benchmark of the KDE methods used for plotting
+
+Usage:
+
+    python benchmark_kde.py [max_events]
+
+The direct estimator ("multivariate") is only evaluated for the
+smallest dataset and the approximate estimator ("tree") only up
+to 1e5 events, because their computation times grow with the
+square of the number of events.
+"""
+from __future__ import division, print_function
+
+import sys
+import time
+
+from dclab import kde_methods
+import numpy as np
+
+from shapeout import kde  # noqa: F401 (registers "fft")
+
+
+def example_data(size):
+    rs = np.random.RandomState(42)
+    x = np.concatenate([rs.normal(50, 10, size//2),
+                        rs.normal(80, 5, size - size//2)])
+    y = np.concatenate([rs.normal(.05, .01, size//2),
+                        rs.normal(.1, .02, size - size//2)])
+    return x, y
+
+
+def benchmark(method, size, kde_kwargs, **kwargs):
+    x, y = example_data(size)
+    t0 = time.time()
+    kde_methods.methods[method](events_x=x, events_y=y,
+                                **dict(kde_kwargs, **kwargs))
+    return time.time() - t0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        max_events = int(float(sys.argv[1]))
+    else:
+        max_events = int(1e7)
+    kde_kwargs = {"fft": {"bw": [2, .005]},
+                  "histogram": {"bins": [100, 100]},
+                  "multivariate": {"bw": [2, .005]},
+                  "tree": {"bw": [2, .005], "rtol": 1e-3},
+                  }
+    print("{:>10} {:>14} {:>10}".format("events", "method", "time [s]"))
+    size = int(1e4)
+    while size <= max_events:
+        for method in ["fft", "histogram", "multivariate", "tree"]:
+            if ((method == "multivariate" and size > 1e4) or
+                    (method == "tree" and size > 1e5)):
+                # takes too long
+                continue
+            dt = benchmark(method, size, kde_kwargs[method])
+            print("{:>10} {:>14} {:>10.3f}".format(size, method, dt))
+        size *= 10
@@ -2,6 +2,10 @@
 # -*- coding: utf-8 -*-
 from __future__ import division, print_function
 
+import pathlib
+import shutil
+import tempfile
+
 import dclab
 import numpy as np
 
@@ -18,6 +22,80 @@ def test_basic():
     assert len(anal.measurements) == 1
 
 
+def test_filter_only_changed():
+    dicts = [example_data_dict(s) for s in [10, 100]]
+    anal = analysis.Analysis([dclab.new_dataset(d) for d in dicts])
+    anal.SetParameters({"filtering": {"deform max": .5}})
+    calls = []
+    for mm in anal:
+        mm.apply_filter = lambda mm=mm: calls.append(mm.identifier)
+    # plotting keys do not trigger filtering
+    anal.SetParameters({"plotting": {"scatter marker size": 3}})
+    assert calls == []
+    # setting the same filter value again does not trigger filtering
+    anal.SetParameters({"filtering": {"deform max": .5}})
+    assert calls == []
+    # manual filters are taken into account
+    anal[1].filter.manual[0] = False
+    anal.SetParameters({"plotting": {"scatter marker size": 2}})
+    assert calls == [anal[1].identifier]
+
+
+def test_get_plot_state():
+    dicts = [example_data_dict(s) for s in [10, 100]]
+    anal = analysis.Analysis([dclab.new_dataset(d) for d in dicts])
+    anal.SetParameters({"filtering": {"deform max": .5}})
+    states = [anal.get_plot_state(mm) for mm in anal]
+    # filter change of one measurement
+    anal[1].filter.manual[0] = False
+    anal.SetParameters({"plotting": {"scatter marker size": 3}})
+    new = [anal.get_plot_state(mm) for mm in anal]
+    assert new[0][0] == states[0][0]
+    assert new[1][0] == states[1][0] + 1
+    assert new[0][1] != states[0][1]
+    # unchanged
+    anal.SetParameters({"plotting": {"scatter marker size": 3}})
+    assert [anal.get_plot_state(mm) for mm in anal] == new
+    # the plotting range does not change the plotted data
+    anal.set_plot_range({"area_um min": 10, "area_um max": 20})
+    assert [anal.get_plot_state(mm) for mm in anal] == new
+
+
+def test_set_plot_range():
+    ds = dclab.new_dataset(example_data_dict(size=100))
+    anal = analysis.Analysis([ds])
+    calls = []
+    ds.apply_filter = lambda: calls.append(ds.identifier)
+    anal.set_plot_range({"area_um min": 10, "area_um max": 20,
+                         "deform max": .3})
+    assert calls == []
+    assert ds.config["plotting"]["area_um min"] == 10
+    assert ds.config["plotting"]["area_um max"] == 20
+    assert ds.config["plotting"]["deform max"] == .3
+    # inverted range
+    anal.set_plot_range({"area_um min": 30, "area_um max": 20})
+    assert ds.config["plotting"]["area_um min"] == 20
+    assert ds.config["plotting"]["area_um max"] == 30
+    try:
+        anal.set_plot_range({"scatter marker size": 3})
+    except ValueError:
+        pass
+    else:
+        assert False, "only plotting range keys allowed"
+
+
+def test_filter_only_changed_hierarchy():
+    ds = dclab.new_dataset(example_data_dict(size=100))
+    child = dclab.new_dataset(ds)
+    anal = analysis.Analysis([ds, child])
+    assert len(child) == 100
+    # the child must be filtered after the parent
+    anal.measurements = [child, ds]
+    ds.config["filtering"]["deform max"] = .5
+    anal.SetParameters({"plotting": {"scatter marker size": 3}})
+    assert len(child) == np.sum(ds["deform"] <= .5)
+
+
 def test_get_feat_range_opt():
     keys = ["area_um", "deform", "fl1_max"]
     dicts = [example_data_dict(s, keys) for s in [10, 100, 12, 382]]
@@ -50,6 +128,48 @@ def test_get_feat_range_opt():
                        (0.051197602631569354, 1.0))
 
 
+def test_get_feat_concat():
+    ds1 = dclab.new_dataset(example_data_dict(size=100))
+    ds2 = dclab.new_dataset(example_data_dict(size=200))
+    anal = analysis.Analysis([ds1, ds2])
+    ds2.filter.manual[:50] = False
+    anal._apply_filters()
+    values, index = anal.get_feat_concat("deform")
+    assert values.size == 250
+    assert np.all(values[index == 0] == ds1["deform"])
+    assert np.all(values[index == 1] == ds2["deform"][50:])
+    assert np.all(np.bincount(index) == [100, 150])
+    # cached
+    assert anal.get_feat_concat("deform")[0] is values
+    values2, _ = anal.get_feat_concat("deform", filtered=False)
+    assert values2.size == 300
+    # filter changes
+    ds1.filter.manual[:10] = False
+    anal._apply_filters()
+    values3, index3 = anal.get_feat_concat("deform")
+    assert values3.size == 240
+    assert np.all(values3[index3 == 0] == ds1["deform"][10:])
+    # reordering
+    anal.measurements = anal.measurements[::-1]
+    values4, index4 = anal.get_feat_concat("deform")
+    assert np.all(values4[index4 == 0] == ds2["deform"][50:])
+
+
+def test_get_feat_range_opt_cache():
+    dicts = [example_data_dict(s) for s in [10, 100]]
+    anal = analysis.Analysis([dclab.new_dataset(d) for d in dicts])
+    rmin, rmax = anal.get_feat_range_opt(feature="area_um")
+    assert rmax > .5
+    summary = anal._get_feat_summary(anal[1], "area_um")
+    assert anal._get_feat_summary(anal[1], "area_um") is summary
+    # filter changes invalidate the cache
+    anal.SetParameters({"filtering": {"area_um max": .5}})
+    assert anal._get_feat_summary(anal[1], "area_um") is not summary
+    rmin2, rmax2 = anal.get_feat_range_opt(feature="area_um")
+    assert rmin2 == rmin
+    assert rmax2 <= .5
+
+
 def test_get_config_value():
     ddict = example_data_dict(size=8472)
     ds1 = dclab.new_dataset(ddict)
@@ -88,6 +208,170 @@ def test_axes_usable():
         assert ax in axes
 
 
+def test_clear_plots():
+    class DummyData(object):
+        def __init__(self):
+            self.arrays = {"index": np.arange(10)}
+
+        def del_data(self, name):
+            self.arrays.pop(name)
+
+        def list_data(self):
+            return list(self.arrays.keys())
+
+    class DummyPlot(object):
+        def __init__(self):
+            self.data = DummyData()
+            self.plots = {"scatter_events": [], "excluded_events": []}
+
+        def delplot(self, *names):
+            for name in names:
+                self.plots.pop(name)
+
+    ds = dclab.new_dataset(example_data_dict(size=100))
+    anal = analysis.Analysis([ds])
+    plot1 = DummyPlot()
+    plot2 = DummyPlot()
+    plot3 = DummyPlot()
+    anal.register_plot(plot1, ds)
+    anal.register_plot(plot2)
+    anal.register_plot(plot3, ds)
+    # plots that are not used anymore are not kept alive
+    del plot3
+    assert len(anal._plots[ds.identifier]) == 1
+    anal._clear()
+    for plot in [plot1, plot2]:
+        assert plot.plots == {}
+        assert plot.data.arrays == {}
+    assert anal._plots == {}
+
+
+def test_kde_spacing_cache():
+    analysis.KDE_SPACING_CACHE.clear()
+    ddict = example_data_dict(size=8472)
+    anal = analysis.Analysis([dclab.new_dataset(ddict)])
+    # one entry for each axis
+    assert len(analysis.KDE_SPACING_CACHE) == 2
+    acc = anal[0].config["plotting"]["kde accuracy area_um"]
+    anal.reset_plot()
+    assert len(analysis.KDE_SPACING_CACHE) == 2
+    assert anal[0].config["plotting"]["kde accuracy area_um"] == acc
+    # changing the scale requires a new entry
+    plotting = anal.GetParameters("plotting")
+    plotting["scale x"] = "log"
+    anal.SetParameters({"plotting": plotting})
+    assert len(analysis.KDE_SPACING_CACHE) == 3
+    assert anal[0].config["plotting"]["kde accuracy area_um"] != acc
+
+
+def test_memory_budget():
+    ddict = example_data_dict(size=1000, keys=["area_um", "deform",
+                                               "size_x", "size_y"])
+    # only one ancillary feature column (8000 bytes) fits
+    anal = analysis.Analysis([dclab.new_dataset(ddict)],
+                             memory_budget=10000)
+    mm = anal[0]
+    usage = anal.get_memory_usage()[0]
+    aspect = np.array(mm["aspect"], copy=True)
+    assert "aspect" in mm._ancillaries
+    assert anal.get_memory_usage()[0] == usage + aspect.nbytes
+    mm["index"]
+    # "aspect" was evicted
+    assert "aspect" not in mm._ancillaries
+    assert "index" in mm._ancillaries
+    assert anal.memory.nbytes <= 10000
+    # and is computed again when needed
+    assert np.all(mm["aspect"] == aspect)
+    assert "index" not in mm._ancillaries
+
+
+def test_statistics_cache():
+    analysis.STATISTICS_CACHE.clear()
+    ds1 = dclab.new_dataset(example_data_dict(size=100))
+    ds2 = dclab.new_dataset(example_data_dict(size=200))
+    anal = analysis.Analysis([ds1, ds2], workers=2)
+    head, data = anal.GetStatisticsBasic()
+    assert len(analysis.STATISTICS_CACHE) == 2
+    assert data[0][0] == ds1.title
+    assert data[1][head.index("Events")] == 200
+    # no new computation
+    assert anal.GetStatisticsBasic() == (head, data)
+    assert len(analysis.STATISTICS_CACHE) == 2
+    # filter changes require a new computation
+    ds2.filter.manual[:50] = False
+    anal._apply_filters()
+    head2, data2 = anal.GetStatisticsBasic()
+    assert len(analysis.STATISTICS_CACHE) == 3
+    assert data2[0] == data[0]
+    assert data2[1][head.index("Events")] == 150
+
+
+def test_load_error():
+    edest = pathlib.Path(tempfile.mkdtemp(prefix="shapeout_test"))
+    paths = make_rtdc_files(edest, 2)
+    broken = edest / "broken.rtdc"
+    with broken.open("wb") as fd:
+        fd.write(b"no hdf5 data")
+    try:
+        analysis.Analysis([paths[0], broken, paths[1]], workers=2)
+    except analysis.MeasurementLoadError as exc:
+        assert len(exc.errors) == 1
+        assert exc.errors[0][0] == broken
+    else:
+        assert False, "broken file should raise error"
+    # sequential loading raises the original error
+    try:
+        analysis.Analysis([paths[0], broken, paths[1]], workers=1)
+    except analysis.MeasurementLoadError:
+        assert False, "error should not be wrapped"
+    except Exception:
+        pass
+    else:
+        assert False, "broken file should raise error"
+    shutil.rmtree(str(edest), ignore_errors=True)
+
+
+def test_load_workers():
+    edest = pathlib.Path(tempfile.mkdtemp(prefix="shapeout_test"))
+    paths = make_rtdc_files(edest, 5)
+    anal1 = analysis.Analysis(paths, workers=1)
+    anal3 = analysis.Analysis(paths, workers=3)
+    assert anal3.GetFilenames() == paths
+    for mm1, mm3 in zip(anal1, anal3):
+        assert mm1.config["plotting"] == mm3.config["plotting"]
+    shutil.rmtree(str(edest), ignore_errors=True)
+
+
+def make_rtdc_files(edest, number):
+    features = ["area_um", "deform", "time"]
+    paths = []
+    for ii in range(number):
+        ds = dclab.new_dataset(example_data_dict(ii + 10, keys=features))
+        ds.config.update({"experiment": {"sample": "test", "run index": ii},
+                          "imaging": {"pixel size": 0.34},
+                          "setup": {"channel width": 20,
+                                    "chip region": "channel",
+                                    "flow rate": 0.04}})
+        path = edest / "M{}_data.rtdc".format(ii)
+        ds.export.hdf5(path=path, features=features)
+        paths.append(path)
+    return paths
+
+
+def test_axes_usable_append():
+    keys1 = ["area_um", "deform", "bright_avg"]
+    keys2 = ["area_um", "deform"]
+    ds1 = dclab.new_dataset(example_data_dict(10, keys=keys1))
+    ds2 = dclab.new_dataset(example_data_dict(10, keys=keys2))
+    anal = analysis.Analysis([ds1])
+    assert "bright_avg" in anal.get_usable_features()
+    assert "bright_sd" in anal.get_unusable_features()
+    anal.append(ds2)
+    assert "bright_avg" in anal.get_unusable_features()
+    anal.measurements = [ds1]
+    assert "bright_avg" in anal.get_usable_features()
+
+
 if __name__ == "__main__":
     # Run all tests
     loc = locals()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function
+
+import dclab
+import numpy as np
+
+from shapeout.util.event_images import EventImageCache, get_prefetch_order
+
+from helper_methods import example_data_dict
+
+
+def example_dataset(size=30):
+    ddict = example_data_dict(size=size)
+    rs = np.random.RandomState(42)
+    ddict["image"] = rs.randint(0, 255, (size, 10, 12)).astype(np.uint8)
+    mask = np.zeros((size, 10, 12), dtype=bool)
+    mask[:, 3:7, 4:9] = True
+    ddict["mask"] = mask
+    return dclab.new_dataset(ddict)
+
+
+def test_get_rgb():
+    ds = example_dataset()
+    cache = EventImageCache(ds)
+    rgb = cache.get_rgb(5)
+    assert rgb.shape == (10, 12, 3)
+    # contour in red
+    assert np.all(rgb[3, 4] == (255, 0, 0))
+    assert np.all(rgb[4, 5] == ds["image"][5][4, 5])
+    assert np.all(rgb[0, 0] == ds["image"][5][0, 0])
+    # without contour
+    raw = cache.get_rgb(5, contour=False)
+    assert np.all(raw[3, 4] == ds["image"][5][3, 4])
+    # cached
+    assert cache.get(5)[0] is cache.get(5)[0]
+
+
+def test_prefetch():
+    ds = example_dataset()
+    ds.filter.manual[12:20] = False
+    ds.apply_filter()
+    cache = EventImageCache(ds, prefetch=2)
+    cache.prefetch(10)
+    cache.wait()
+    assert sorted(cache._cache._data.keys()) == [8, 9, 11, 12, 20]
+    assert 10 not in cache._cache
+
+
+def test_prefetch_order():
+    assert get_prefetch_order(5, 10, 2) == [6, 4, 7, 3]
+    assert get_prefetch_order(0, 10, 2) == [1, 2]
+    assert get_prefetch_order(9, 10, 2) == [8, 7]
+    # filtered events
+    filtered = np.array([0, 1, 2, 5, 20, 30, 40])
+    assert get_prefetch_order(5, 50, 2, filtered=filtered) == \
+        [6, 4, 20, 2, 7, 3, 30, 1]
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
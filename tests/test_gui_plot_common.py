@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test common plotting methods"""
+from __future__ import division, print_function
+
+import dclab
+import numpy as np
+
+from shapeout import analysis
+from shapeout.gui import plot_common
+
+from helper_methods import example_data_dict
+
+
+def get_measurements(pixel_sizes):
+    dss = [dclab.new_dataset(example_data_dict(size=100))
+           for _ in pixel_sizes]
+    for ds, px_um in zip(dss, pixel_sizes):
+        ds.config["imaging"]["pixel size"] = px_um
+        ds.config["setup"]["channel width"] = 20
+    anal = analysis.Analysis(dss)
+    return anal
+
+
+def test_isoelastics_cache():
+    anal = get_measurements([.34, .34, .3])
+    anal.set_config_value("plotting", "isoelastics", "numerical")
+    plot_common.ISOELASTICS_CACHE.clear()
+    isoel = [plot_common.get_isoelastics(mm) for mm in anal]
+    assert isoel[0]
+    # same parameters
+    assert isoel[1] is isoel[0]
+    # different pixel size (pixelation error correction)
+    assert isoel[2] is not isoel[0]
+    assert not np.allclose(isoel[2][0], isoel[0][0])
+    # different axes
+    anal.set_config_value("plotting", "axis x", "deform")
+    anal.set_config_value("plotting", "axis y", "area_um")
+    swapped = plot_common.get_isoelastics(anal[0])
+    assert swapped
+    assert np.allclose(swapped[0][:, :2], isoel[0][0][:, 1::-1])
+    anal.set_config_value("plotting", "axis x", "area_um")
+    anal.set_config_value("plotting", "axis y", "deform")
+    assert plot_common.get_isoelastics(anal[0]) is isoel[0]
+    # not shown
+    anal.set_config_value("plotting", "isoelastics", "not shown")
+    assert plot_common.get_isoelastics(anal[0]) is None
+
+
+def test_isoelastics_legacy():
+    anal = get_measurements([.34, .3])
+    # the legacy lines are only loaded when needed
+    plot_common._LEGACY_ISOELASTICS = None
+    anal.set_config_value("plotting", "isoelastics", "numerical")
+    numerical = plot_common.get_isoelastics(anal[0])
+    assert plot_common._LEGACY_ISOELASTICS is None
+    anal.set_config_value("plotting", "isoelastics", "legacy")
+    legacy = [plot_common.get_isoelastics(mm) for mm in anal]
+    assert plot_common._LEGACY_ISOELASTICS is not None
+    assert legacy[0]
+    assert legacy[0] is not numerical
+    # no pixelation error correction for the legacy lines
+    assert legacy[1] is legacy[0]
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
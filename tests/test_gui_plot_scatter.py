@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Test scatter plot data"""
+from __future__ import division, print_function
+
+import dclab
+import numpy as np
+
+from shapeout import analysis, kde
+from shapeout.gui import plot_scatter
+
+from helper_methods import example_data_dict
+
+
+def test_scatter_data_cache():
+    ds = dclab.new_dataset(example_data_dict(size=5000))
+    anal = analysis.Analysis([ds])
+    anal.SetParameters({"plotting": {"downsampling": True,
+                                     "downsample events": 1000}})
+    plot_scatter.SCATTER_CACHE.clear()
+    assert not plot_scatter.is_scatter_data_cached(ds)
+    data = plot_scatter.get_scatter_data(ds)
+    assert data[0].size == 1000
+    assert plot_scatter.is_scatter_data_cached(ds)
+    # served from the cache
+    data2 = plot_scatter.get_scatter_data(ds)
+    for a, b in zip(data, data2):
+        assert a is b
+    # unrelated plotting parameter
+    anal.SetParameters({"plotting": {"scatter marker size": 5}})
+    assert plot_scatter.is_scatter_data_cached(ds)
+    # a filter change invalidates the cached data
+    anal.SetParameters({"filtering": {"deform max": .5}})
+    assert not plot_scatter.is_scatter_data_cached(ds)
+    data3 = plot_scatter.get_scatter_data(ds)
+    assert np.all(ds["deform"][data3[3]] <= .5)
+    assert np.any(data3[3] != data[3])
+
+
+def test_scatter_data_preview():
+    ds = dclab.new_dataset(example_data_dict(size=5000))
+    anal = analysis.Analysis([ds])
+    # preview data are computed with a histogram density
+    anal.SetParameters({"plotting": {"kde": "multivariate"}})
+    plot_scatter.SCATTER_CACHE.clear()
+    kde.BINNING_CACHE.clear()
+    x, y, density, mask = plot_scatter.get_scatter_data(ds, preview=True)
+    assert x.size == density.size < 5000
+    assert np.all(density > 0)
+    # the binning of all events is only computed for the full plot
+    assert len(kde.BINNING_CACHE) == 0
+
+
+def test_scatter_cache_size():
+    plot_scatter.set_cache_size(5)
+    assert plot_scatter.SCATTER_CACHE.maxsize == 50
+    assert plot_scatter.INDEX_CACHE.maxsize == 20
+    plot_scatter.set_cache_size(100)
+    assert plot_scatter.SCATTER_CACHE.maxsize == 300
+    assert plot_scatter.INDEX_CACHE.maxsize == 100
+    plot_scatter.set_cache_size(0)
+    assert plot_scatter.SCATTER_CACHE.maxsize == 50
+    assert plot_scatter.INDEX_CACHE.maxsize == 20
+
+
+def test_scatter_index_cache():
+    dss = [dclab.new_dataset(example_data_dict(size=100 + ii))
+           for ii in range(30)]
+    analysis.Analysis(dss)
+    plot_scatter.set_cache_size(len(dss))
+    indices = [plot_scatter.get_scatter_index(ds) for ds in dss]
+    # all indices are reused when zooming or panning
+    for ds, index in zip(dss, indices):
+        assert plot_scatter.get_scatter_index(ds) is index
+    plot_scatter.set_cache_size(0)
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
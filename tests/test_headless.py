@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""The analysis core must be usable without a GUI toolkit"""
+from __future__ import division, print_function
+
+import json
+import subprocess
+import sys
+
+#: maximum time [s] allowed for importing the analysis core
+IMPORT_TIME_BUDGET = 5
+
+#: top-level packages of the GUI stack
+GUI_PACKAGES = ["chaco", "enable", "kiva", "pyface", "traits", "wx"]
+
+CORE_MODULES = ["shapeout.analysis",
+                "shapeout.kde",
+                "shapeout.lin_mix_mod",
+                "shapeout.meta_tool",
+                "shapeout.session.rw",
+                ]
+
+SCRIPT = """
+import json
+import sys
+import time
+
+t0 = time.time()
+for name in {modules}:
+    __import__(name)
+duration = time.time() - t0
+gui = sorted(set(mod.split(".")[0] for mod in sys.modules
+                 if mod.split(".")[0] in {packages}))
+sys.stdout.write("\\n" + json.dumps({{"time": duration, "gui": gui}}))
+"""
+
+
+def import_core():
+    """Import the core modules in a fresh interpreter"""
+    script = SCRIPT.format(modules=CORE_MODULES, packages=GUI_PACKAGES)
+    out = subprocess.check_output([sys.executable, "-c", script])
+    # other output may be printed during import
+    return json.loads(out.decode("utf-8").strip().split("\n")[-1])
+
+
+def test_import_no_gui():
+    res = import_core()
+    assert res["gui"] == []
+
+
+def test_import_time():
+    res = import_core()
+    assert res["time"] < IMPORT_TIME_BUDGET
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function
+
+import threading
+import warnings
+
+import dclab
+from dclab import kde_contours
+import numpy as np
+
+from shapeout import analysis, kde
+
+from helper_methods import example_data_dict
+
+
+def exact_gauss(x, y, xout, yout, bw):
+    """Direct evaluation of a Gaussian KDE with a diagonal bandwidth"""
+    dx = (xout[:, np.newaxis] - x[np.newaxis, :]) / bw[0]
+    dy = (yout[:, np.newaxis] - y[np.newaxis, :]) / bw[1]
+    density = np.exp(-.5*(dx**2 + dy**2)).sum(axis=1)
+    return density / (2*np.pi*bw[0]*bw[1]*x.size)
+
+
+def example_bimodal(size=10000):
+    rs = np.random.RandomState(42)
+    x = np.concatenate([rs.normal(50, 10, size//2),
+                        rs.normal(80, 5, size//2)])
+    y = np.concatenate([rs.normal(.05, .01, size//2),
+                        rs.normal(.1, .02, size//2)])
+    return x, y
+
+
+def get_contour_kwargs(size=1000, kde_type="histogram"):
+    ddict = example_data_dict(size=size)
+    kwargs = {"x": ddict["area_um"],
+              "y": ddict["deform"],
+              "xax": "area_um",
+              "yax": "deform",
+              "xscale": "linear",
+              "yscale": "linear",
+              "kde_type": kde_type,
+              "kde_acc": (.05, .05),
+              "contour_acc": (.02, .02),
+              "levels": [.5, .95],
+              "mode": "quantile",
+              }
+    return kwargs
+
+
+def test_compute_contours():
+    kw = get_contour_kwargs()
+    contours, timing = kde.compute_contours(**kw)
+    assert len(contours) == 2
+    assert sorted(timing.keys()) == ["contours", "kde", "levels"]
+    # compare to computation with the original dataset
+    ds = dclab.new_dataset(example_data_dict(size=1000))
+    kde_kwargs = kde.get_kde_kwargs(x=ds["area_um"], y=ds["deform"],
+                                    kde_type="histogram",
+                                    xacc=.05, yacc=.05,
+                                    xscale="linear", yscale="linear")
+    X, Y, density = ds.get_kde_contour(xax="area_um", yax="deform",
+                                       xacc=.02, yacc=.02,
+                                       kde_type="histogram",
+                                       kde_kwargs=kde_kwargs)
+    # The quantile levels are computed from the density at the events
+    # (instead of interpolating the density on the contour grid).
+    dp = dclab.kde_methods.kde_histogram(ds["area_um"], ds["deform"],
+                                         **kde_kwargs)
+    plev = np.percentile(dp / density.max(), [50, 95])
+    plev_grid = kde_contours.get_quantile_levels(density, x=X, y=Y,
+                                                 xp=ds["area_um"],
+                                                 yp=ds["deform"],
+                                                 q=np.array([.5, .95]),
+                                                 normalize=True)
+    assert np.allclose(plev, plev_grid, rtol=.01, atol=0)
+    cc = kde_contours.find_contours_level(density, x=X, y=Y, level=plev[1])
+    assert len(cc) == len(contours[1])
+    for a, b in zip(cc, contours[1]):
+        assert np.allclose(a, b)
+
+
+def test_compute_contours_parallel():
+    kwargs_list = [get_contour_kwargs(size=ii*500) for ii in range(1, 5)]
+    # jobs with a binning are computed in the current process
+    kw = kwargs_list[1]
+    kw["binning"] = kde.HistogramBinning(x=kw["x"], y=kw["y"],
+                                         xacc=kw["kde_acc"][0],
+                                         yacc=kw["kde_acc"][1])
+    serial = kde.compute_contours_parallel(kwargs_list, workers=1)
+    parallel = kde.compute_contours_parallel(kwargs_list, workers=2)
+    assert len(parallel) == 4
+    for (cs, _), (cp, _) in zip(serial, parallel):
+        for ls, lp in zip(cs, cp):
+            assert len(ls) == len(lp)
+            for a, b in zip(ls, lp):
+                assert np.all(a == b)
+    pool = kde.get_pool(2)
+    assert kde.get_pool(2) is pool
+    kde.close_pool()
+    assert kde.get_pool(2) is not pool
+    kde.close_pool()
+
+
+def test_compute_contours_parallel_binning():
+    # The density at the events is computed with the shared binning
+    # (not with a copy in a worker process).
+    kwargs_list = [get_contour_kwargs(size=ii*500) for ii in range(1, 4)]
+    binnings = []
+    for kw in kwargs_list:
+        kw["binning"] = kde.HistogramBinning(x=kw["x"], y=kw["y"],
+                                             xacc=kw["kde_acc"][0],
+                                             yacc=kw["kde_acc"][1])
+        binnings.append(kw["binning"])
+    # computed in threads
+    parallel = kde.compute_contours_parallel(kwargs_list, workers=2)
+    for binning in binnings:
+        assert binning._event_density is not None
+    serial = kde.compute_contours_parallel(kwargs_list, workers=1)
+    for (cs, _), (cp, _) in zip(serial, parallel):
+        for ls, lp in zip(cs, cp):
+            assert len(ls) == len(lp)
+            for a, b in zip(ls, lp):
+                assert np.all(a == b)
+
+
+def test_histogram_binning_refilter():
+    # The filter is changed by another thread while the binning is
+    # computed; the cached binning must belong to the old filter.
+    ds = dclab.new_dataset(example_data_dict(size=1000))
+    anal = analysis.Analysis([ds])
+    kde.BINNING_CACHE.clear()
+    threads = []
+
+    def refilter():
+        ds.filter.manual[:500] = False
+        anal._apply_filters()
+
+    class RefilterDataset(ds.__class__):
+        def __getitem__(self, feat):
+            if not threads:
+                threads.append(threading.Thread(target=refilter))
+                threads[0].start()
+                # the thread waits for the dataset lock
+                threads[0].join(.1)
+            return super(RefilterDataset, self).__getitem__(feat)
+
+    ds.__class__ = RefilterDataset
+    binning = kde.get_histogram_binning(ds, "area_um", "deform", .1, .1)
+    threads[0].join()
+    assert binning.index.size == 1000
+    binning2 = kde.get_histogram_binning(ds, "area_um", "deform", .1, .1)
+    assert binning2.index.size == 500
+
+
+def test_histogram_binning_cache_size():
+    kde.set_cache_size(5)
+    assert kde.BINNING_CACHE.maxsize == 20
+    kde.set_cache_size(150)
+    assert kde.BINNING_CACHE.maxsize == 300
+    kde.set_cache_size(0)
+    assert kde.BINNING_CACHE.maxsize == 20
+
+
+def test_histogram_binning():
+    x, y = example_bimodal(size=5000)
+    x[10] = np.nan
+    for scale, acc, cacc in [["linear", (2, .005), (.5, .001)],
+                             ["log", (.05, .05), (.02, .02)]]:
+        binning = kde.HistogramBinning(x, y, xacc=acc[0], yacc=acc[1],
+                                       xscale=scale, yscale=scale)
+        kw = kde.get_kde_kwargs(x, y, kde_type="histogram",
+                                xacc=acc[0], yacc=acc[1],
+                                xscale=scale, yscale=scale)
+        assert binning.bins == kw["bins"]
+        ds = dclab.new_dataset({"area_um": x, "deform": y})
+        ref = ds.get_kde_scatter(xax="area_um", yax="deform",
+                                 kde_type="histogram", kde_kwargs=kw,
+                                 xscale=scale, yscale=scale)
+        # density at a subset of events first
+        assert np.allclose(binning.get_event_density(np.arange(100)),
+                           ref[:100], equal_nan=True, rtol=1e-12, atol=0)
+        assert np.allclose(binning.get_event_density(), ref,
+                           equal_nan=True, rtol=1e-12, atol=0)
+        # contour grid
+        X, Y, density = kde.get_binning_contour(binning, cacc)
+        Xr, Yr, refd = ds.get_kde_contour(xax="area_um", yax="deform",
+                                          xacc=cacc[0], yacc=cacc[1],
+                                          kde_type="histogram",
+                                          kde_kwargs=kw,
+                                          xscale=scale, yscale=scale)
+        assert np.allclose(X, Xr)
+        assert np.allclose(Y, Yr)
+        assert np.allclose(density, refd, rtol=1e-12, atol=0)
+
+
+def test_kde_fft_accuracy():
+    x, y = example_bimodal()
+    bw = (2, .005)
+    xout, yout = x[::20], y[::20]
+    exact = exact_gauss(x, y, xout, yout, bw)
+    density = kde.kde_fft(x, y, xout=xout, yout=yout, bw=bw)
+    assert np.max(np.abs(density - exact)) < 0.01 * exact.max()
+    # default bandwidth and evaluation at the events
+    density2 = kde.kde_fft(x[:1000], y[:1000])
+    assert density2.shape == (1000,)
+    assert np.all(density2 > 0)
+
+
+def test_kde_fft_wide_range():
+    # data range much larger than the bandwidth
+    rs = np.random.RandomState(3)
+    x = np.concatenate([rs.normal(0, 1, 500), rs.normal(1e5, 1, 500)])
+    y = np.concatenate([rs.normal(0, .01, 500), rs.normal(100, .01, 500)])
+    bw = (.5, .005)
+    exact = exact_gauss(x, y, x, y, bw)
+    with warnings.catch_warnings(record=True) as wlist:
+        warnings.simplefilter("always")
+        density = kde.kde_fft(x, y, bw=bw)
+    assert len(wlist) == 1
+    assert "'tree' KDE" in str(wlist[0].message)
+    assert np.max(np.abs(density - exact)) < 0.001 * exact.max()
+
+
+def test_kde_fft_contour_grid():
+    x, y = example_bimodal(size=5000)
+    bw = (3, .008)
+    xg, yg = np.meshgrid(np.linspace(20, 100, 30),
+                         np.linspace(0, .2, 40),
+                         indexing="ij")
+    exact = exact_gauss(x, y, xg.flatten(), yg.flatten(), bw)
+    density = kde.kde_fft(x, y, xout=xg, yout=yg, bw=bw)
+    assert density.shape == xg.shape
+    assert np.max(np.abs(density.flatten() - exact)) < 0.01 * exact.max()
+
+
+def test_kde_fft_dataset():
+    # the "fft" KDE is available in dclab
+    assert "fft" in dclab.kde_methods.methods
+    x, y = example_bimodal(size=2000)
+    ds = dclab.new_dataset({"area_um": x, "deform": y})
+    for scale in ["linear", "log"]:
+        kw = kde.get_kde_kwargs(x=x, y=y, kde_type="fft",
+                                xacc=.1, yacc=.1,
+                                xscale=scale, yscale=scale)
+        assert kw == {"bw": [.1, .1]}
+        density = ds.get_kde_scatter(xax="area_um", yax="deform",
+                                     kde_type="fft", kde_kwargs=kw,
+                                     xscale=scale, yscale=scale)
+        ref = ds.get_kde_scatter(xax="area_um", yax="deform",
+                                 kde_type="multivariate", kde_kwargs=kw,
+                                 xscale=scale, yscale=scale)
+        # The bandwidth is large compared to the spread of "deform"
+        # (the kernel curvature dominates the binning error).
+        assert np.max(np.abs(density - ref)) < 0.02 * ref.max()
+
+
+def test_kde_fft_nan():
+    x, y = example_bimodal(size=1000)
+    x[10] = np.nan
+    y[20] = np.inf
+    density = kde.kde_fft(x, y, bw=(2, .005))
+    assert np.isnan(density[10])
+    assert np.isnan(density[20])
+    assert np.sum(np.isnan(density)) == 2
+
+
+def test_kde_tree_accuracy():
+    x, y = example_bimodal(size=5000)
+    bw = (2, .005)
+    # scatter coloring
+    xout, yout = x[::10], y[::10]
+    exact = exact_gauss(x, y, xout, yout, bw)
+    for rtol in [1e-2, 1e-4]:
+        density = kde.kde_tree(x, y, xout=xout, yout=yout, bw=bw, rtol=rtol)
+        assert np.all(np.abs(density - exact) <= rtol * exact)
+    # contour grid (includes positions far away from the events)
+    xg, yg = np.meshgrid(np.linspace(0, 120, 30),
+                         np.linspace(-.05, .25, 40),
+                         indexing="ij")
+    exact = exact_gauss(x, y, xg.flatten(), yg.flatten(), bw)
+    density = kde.kde_tree(x, y, xout=xg, yout=yg, bw=bw, rtol=1e-3)
+    assert density.shape == xg.shape
+    error = np.abs(density.flatten() - exact)
+    assert np.all(error <= 1e-3 * np.maximum(exact, 1e-3 * exact.max()))
+
+
+def test_kde_tree_dataset():
+    assert "tree" in dclab.kde_methods.methods
+    x, y = example_bimodal(size=2000)
+    ds = dclab.new_dataset({"area_um": x, "deform": y})
+    kw = kde.get_kde_kwargs(x=x, y=y, kde_type="tree",
+                            xacc=2, yacc=.005,
+                            xscale="linear", yscale="linear",
+                            rtol=1e-3)
+    assert kw == {"bw": [2, .005], "rtol": 1e-3}
+    density = ds.get_kde_scatter(xax="area_um", yax="deform",
+                                 kde_type="tree", kde_kwargs=kw)
+    ref = ds.get_kde_scatter(xax="area_um", yax="deform",
+                             kde_type="multivariate",
+                             kde_kwargs={"bw": [2, .005]})
+    assert np.allclose(density, ref, rtol=1e-3, atol=0)
+
+
+def test_kde_tree_rtol():
+    x, y = example_bimodal(size=100)
+    for rtol in [0, 1, -.1]:
+        try:
+            kde.kde_tree(x, y, bw=(2, .005), rtol=rtol)
+        except ValueError:
+            pass
+        else:
+            assert False, "invalid tolerance must raise ValueError"
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function
+
+import numpy as np
+
+from shapeout.util.lod import ScatterIndex
+
+
+def example_data(size=20000):
+    rs = np.random.RandomState(42)
+    x = rs.normal(50, 10, size)
+    y = rs.normal(.1, .02, size)
+    return x, y
+
+
+def test_query():
+    x, y = example_data()
+    x[5] = np.nan
+    y[7] = np.inf
+    index = ScatterIndex(x, y)
+    window = (45, 55, .09, .12)
+    idx = index.events[index.query(*window)]
+    with np.errstate(invalid="ignore"):
+        ref = np.where((x >= window[0]) & (x <= window[1]) &
+                       (y >= window[2]) & (y <= window[3]))[0]
+    assert np.all(np.sort(idx) == ref)
+    # window outside of the data
+    assert index.query(200, 300, .09, .12).size == 0
+    # window containing all events
+    assert index.query(-np.inf, np.inf, -np.inf, np.inf).size == x.size - 2
+
+
+def test_downsample():
+    x, y = example_data()
+    index = ScatterIndex(x, y)
+    # constant number of events at every zoom level
+    for window in [(0, 100, 0, .2), (45, 55, .09, .12), (47, 53, .09, .11)]:
+        events = index.downsample(*window, samples=500)
+        assert events.size == 500
+        assert np.all(np.diff(events) > 0)
+        assert np.all((x[events] >= window[0]) & (x[events] <= window[1]))
+        assert np.all((y[events] >= window[2]) & (y[events] <= window[3]))
+        # deterministic
+        assert np.all(events == index.downsample(*window, samples=500))
+    # fewer events than samples in the window
+    window = (49.9, 50, .09, .1)
+    events = index.downsample(*window, samples=500)
+    assert 0 < events.size < 500
+    assert np.all(events == np.sort(index.events[index.query(*window)]))
+    # no downsampling
+    assert index.downsample(0, 100, 0, .2, samples=0).size == x.size
+
+
+def test_downsample_grid():
+    # dense regions are sparsified (as in dclab's downsample_grid)
+    x, y = example_data()
+    index = ScatterIndex(x, y)
+    events = index.downsample(0, 100, 0, .2, samples=2000)
+    center = (np.abs(x - 50) < 5) & (np.abs(y - .1) < .01)
+    assert np.sum(center[events]) / 2000 < np.sum(center) / x.size
+
+
+def test_nearest():
+    x, y = example_data()
+    x[5] = np.nan
+    index = ScatterIndex(x, y)
+    rs = np.random.RandomState(12)
+    points = [(50, .1), (0, 0), (1000, -1), (x[10], y[10])]
+    points += list(zip(rs.uniform(0, 100, 20), rs.uniform(0, .2, 20)))
+    for px, py in points:
+        for xscale, yscale in [(1, 1), (100, .2), (10, .002)]:
+            with np.errstate(invalid="ignore"):
+                dist = np.hypot((x - px) / xscale, (y - py) / yscale)
+            ref = np.nanargmin(dist)
+            event = index.nearest(px, py, xscale, yscale)
+            assert dist[event] == dist[ref]
+    assert index.nearest(x[10], y[10], 100, .2) == 10
+    assert index.nearest(np.nan, .1) is None
+    assert ScatterIndex(np.zeros(0), np.zeros(0)).nearest(1, 1) is None
+    # all events at the same position
+    same = ScatterIndex(np.ones(10), np.ones(10))
+    assert same.nearest(5, 5) in range(10)
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()
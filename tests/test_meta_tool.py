@@ -2,6 +2,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import division, print_function
 
+import os
 import pathlib
 import shutil
 import tempfile
@@ -11,6 +12,7 @@ from dclab import new_dataset
 from helper_methods import example_data_dict, retrieve_data, cleanup
 
 from shapeout import meta_tool
+from shapeout.util.file_index import FileIndex
 
 
 def test_collect_data_tree():
@@ -75,6 +77,37 @@ def test_collect_data_tree_order():
     shutil.rmtree(str(edest), ignore_errors=True)
 
 
+def test_iter_data_tree():
+    features = ["area_um", "deform", "time"]
+    edest = pathlib.Path(tempfile.mkdtemp(prefix="shapeout_test"))
+    for sub in ["a", "b", "b/c"]:
+        (edest / sub).mkdir()
+        for ii in range(1, 4):
+            dat = new_dataset(data=example_data_dict(ii + 10, keys=features))
+            cfg = {"experiment": {"sample": "sample " + sub,
+                                  "run index": ii},
+                   "imaging": {"pixel size": 0.34},
+                   "setup": {"channel width": 20,
+                             "chip region": "channel",
+                             "flow rate": 0.04}
+                   }
+            dat.config.update(cfg)
+            dat.export.hdf5(path=edest / sub / "M{}_data.rtdc".format(ii),
+                            features=features)
+    results = list(meta_tool.iter_data_tree(edest, workers=4, interval=0))
+    sizes = [sum([len(proj) - 1 for proj in tree]) for tree, _ in results]
+    # results are streamed as the measurements are added
+    assert sizes == list(range(1, 10)) + [9]
+    # deterministic order
+    for workers in [1, 8]:
+        assert meta_tool.collect_data_tree(edest, workers=workers) == \
+            results[-1]
+    assert [proj[0][0] for proj in results[-1][0]] == \
+        ["sample a", "sample b", "sample b/c"]
+    assert pathlib.Path(results[-1][0][2][3][1]).name == "M3_data.rtdc"
+    shutil.rmtree(str(edest), ignore_errors=True)
+
+
 def test_collect_data_tree_unicode():
     features = ["area_um", "deform", "time"]
     edest = pathlib.Path(tempfile.mkdtemp(prefix="shapeout_test"))
@@ -107,6 +140,118 @@ def test_event_count_cache_unicode():
     shutil.rmtree(edest, ignore_errors=True)
 
 
+def test_event_count_cache():
+    path = retrieve_data("rtdc_data_traces_video.zip")
+    avi = path.parent / "M1_imaq.avi"
+    assert meta_tool.get_event_count_cache(avi) == 2
+    get_reader = meta_tool.imageio.get_reader
+    md5 = meta_tool.hashlib.md5
+    calls = []
+
+    def broken(*args, **kwargs):
+        calls.append(args)
+        raise ValueError("file should not be read")
+
+    try:
+        meta_tool.imageio.get_reader = broken
+        # neither decoded nor hashed (size and modification time)
+        meta_tool.hashlib.md5 = broken
+        assert meta_tool.get_event_count_cache(avi) == 2
+        assert calls == []
+        # hashed, but not decoded
+        meta_tool.hashlib.md5 = md5
+        os.utime(str(avi), (0, 0))
+        assert meta_tool.get_event_count_cache(avi) == 2
+        assert calls == []
+    finally:
+        meta_tool.imageio.get_reader = get_reader
+        meta_tool.hashlib.md5 = md5
+    cleanup()
+
+
+def test_file_index():
+    tdir = tempfile.mkdtemp(prefix="shapeout_test_index")
+    path = pathlib.Path(tdir) / "data.txt"
+    with path.open("wb") as fd:
+        fd.write(b"peter")
+    index = FileIndex("index.sqlite", directory=tdir, batch_size=2)
+    stat = (5, 1.5)
+    index.set(path, stat, {"a": 1}, content_hash="abc")
+    assert index.get(path, stat) == {"a": 1}
+    assert index.get(path, (5, 2)) is None
+    assert index.get_hash("abc") == {"a": 1}
+    # batch written
+    index2 = FileIndex("index.sqlite", directory=tdir)
+    assert index2.get(path, stat) == {"a": 1}
+    assert index2.get_hash("abc") == {"a": 1}
+    assert index2.get_hash("def") is None
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+def test_get_metadata():
+    path = retrieve_data("rtdc_data_hdf5_contour_image_trace.zip")
+    tdir = tempfile.mkdtemp(prefix="shapeout_test_index")
+    index = FileIndex("index.sqlite", directory=tdir)
+    meta = meta_tool.get_metadata(path, index=index)
+    assert meta == {"verified": True,
+                    "chip region": meta_tool.get_chip_region(path),
+                    "event count": meta_tool.get_event_count(path),
+                    "flow rate": meta_tool.get_flow_rate(path),
+                    "run index": meta_tool.get_run_index(path),
+                    "sample": meta_tool.get_sample_name(path)}
+    # persistent index
+    index.flush()
+    index2 = FileIndex("index.sqlite", directory=tdir)
+    extract = meta_tool._extract_metadata
+    calls = []
+    meta_tool._extract_metadata = lambda f: calls.append(f) or extract(f)
+    try:
+        assert meta_tool.get_metadata(path, index=index2) == meta
+        assert calls == []
+        # modified files are read again
+        os.utime(str(path), (0, 0))
+        assert meta_tool.get_metadata(path, index=index2) == meta
+        assert len(calls) == 1
+    finally:
+        meta_tool._extract_metadata = extract
+    index2.flush()
+    shutil.rmtree(tdir, ignore_errors=True)
+    cleanup()
+
+
+def test_flush_indexes():
+    tdir = tempfile.mkdtemp(prefix="shapeout_test_index")
+    index = FileIndex("index.sqlite", directory=tdir)
+    index.set_hash("abc", 5)
+    meta_tool._METADATA_INDEX.insert(0, index)
+    try:
+        meta_tool.flush_indexes()
+    finally:
+        meta_tool._METADATA_INDEX.remove(index)
+    index2 = FileIndex("index.sqlite", directory=tdir)
+    assert index2.get_hash("abc") == 5
+    shutil.rmtree(tdir, ignore_errors=True)
+
+
+def test_get_metadata_tdms():
+    path = retrieve_data("rtdc_data_minimal.zip")
+    tdir = tempfile.mkdtemp(prefix="shapeout_test_index")
+    index = FileIndex("index.sqlite", directory=tdir)
+    meta = meta_tool.get_metadata(path, index=index)
+    assert meta["verified"]
+    assert meta["chip region"] == "channel"
+    assert meta["event count"] == 156
+    assert meta["flow rate"] == .12
+    assert meta["run index"] == 1
+    assert meta["sample"] == meta_tool.get_sample_name(path)
+    # changes of the configuration files are detected
+    (path.parent / "M1_camera.ini").unlink()
+    assert not meta_tool.get_metadata(path, index=index)["verified"]
+    index.flush()
+    shutil.rmtree(tdir, ignore_errors=True)
+    cleanup()
+
+
 def test_hdf5():
     path = retrieve_data("rtdc_data_hdf5_contour_image_trace.zip")
     assert meta_tool.get_chip_region(path) == "channel"
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function
+
+import threading
+
+from shapeout.util.progressive import Refiner
+
+
+def test_refine():
+    applied = []
+    refiner = Refiner()
+    jobs = [(lambda ii=ii: ii**2, applied.append) for ii in range(5)]
+    refiner.start(jobs)
+    refiner.wait()
+    assert applied == [0, 1, 4, 9, 16]
+    assert not refiner.running
+
+
+def test_refine_cancel():
+    applied = []
+    computed = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def compute_slow():
+        computed.append("slow")
+        started.set()
+        release.wait(5)
+        return "slow"
+
+    def compute_fast():
+        computed.append("fast")
+        return "fast"
+
+    refiner = Refiner()
+    refiner.start([(compute_slow, applied.append),
+                   (compute_fast, applied.append)])
+    started.wait(5)
+    first = refiner._thread
+    # new settings while the first job is computed
+    refiner.start([(compute_fast, applied.append)])
+    refiner.wait()
+    release.set()
+    first.join(5)
+    # only the job started last was applied
+    assert applied == ["fast"]
+    assert computed == ["slow", "fast"]
+
+
+def test_refine_deliver():
+    # results are discarded if cancelled before delivery
+    delivered = []
+    applied = []
+    refiner = Refiner(deliver=lambda *args: delivered.append(args))
+    refiner.start([(lambda: 1, applied.append)])
+    refiner.wait()
+    assert len(delivered) == 1
+    refiner.cancel()
+    func, args = delivered[0][0], delivered[0][1:]
+    func(*args)
+    assert applied == []
+
+
+if __name__ == "__main__":
+    # Run all tests
+    loc = locals()
+    for key in list(loc.keys()):
+        if key.startswith("test_") and hasattr(loc[key], "__call__"):
+            loc[key]()